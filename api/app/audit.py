@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .utils import json_default
+
+logger = logging.getLogger(__name__)
+
+ACTION = 'action'
+TRIALS = 'trials'
+
+Record = Tuple[str, Tuple]
+Writer = Callable[[List[Tuple], List[Tuple]], None]
+
+MAX_RETRY_DELAY = 2.0
+
+
+class AuditLogWriter:
+    """Background writer coalescing action and trial inserts into batches.
+
+    Records are queued with their payloads still as Python objects and are
+    JSON-encoded on the writer thread. A full queue blocks producers for up
+    to ``enqueue_timeout`` seconds and then falls back to a synchronous write.
+    A batch that hits a busy or locked database is retried with backoff until
+    it lands; only a record that is itself unwritable is ever dropped.
+    """
+
+    def __init__(
+        self,
+        writer: Writer,
+        batch_size: int,
+        interval: float,
+        max_queue: int,
+        enqueue_timeout: float,
+        retryable: Callable[[Exception], bool] = lambda exc: False,
+        retry_backoff: float = 0.05,
+    ):
+        self._writer = writer
+        self.batch_size = batch_size
+        self.interval = interval
+        self.enqueue_timeout = enqueue_timeout
+        self.retryable = retryable
+        self.retry_backoff = retry_backoff
+        self._queue: "Queue[Union[Record, Event, None]]" = Queue(maxsize=max_queue)
+        self._thread: Optional[Thread] = None
+        self._start_lock = Lock()
+        self._metrics_lock = Lock()
+        self._rows_written = 0
+        self._batches = 0
+        self._sync_fallbacks = 0
+        self._retries = 0
+        self._rows_dropped = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    def submit_action(
+        self, session_id: str, action_type: str, payload: Dict, created_at: str, snapshot: Optional[Tuple] = None
+    ) -> None:
+        self._submit((ACTION, (session_id, action_type, payload, created_at, snapshot)))
+
+    def submit_trials(
+        self, session_id: str, scope: str, n: int, counts: Dict[str, int], freqs: Dict[str, float], created_at: str
+    ) -> None:
+        self._submit((TRIALS, (session_id, scope, n, counts, freqs, created_at)))
+
+    def _submit(self, record: Record) -> None:
+        self.start()
+        try:
+            self._queue.put(record, timeout=self.enqueue_timeout)
+        except Full:
+            with self._metrics_lock:
+                self._sync_fallbacks += 1
+            self._write([record])
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        if self._thread is None or not self._thread.is_alive():
+            self._drain_inline()
+            return True
+        done = Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self) -> None:
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+        self._drain_inline()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._metrics_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'rows_written': self._rows_written,
+                'batches': self._batches,
+                'sync_fallbacks': self._sync_fallbacks,
+                'retries': self._retries,
+                'rows_dropped': self._rows_dropped,
+                'last_flush_ms': round(self._last_flush_ms, 3),
+                'max_flush_ms': round(self._max_flush_ms, 3),
+            }
+
+    def _drain_inline(self) -> None:
+        pending: List[Record] = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+            if isinstance(item, Event):
+                item.set()
+            elif item is not None:
+                pending.append(item)
+        if pending:
+            self._write_durably(pending)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch: List[Record] = []
+            waiters: List[Event] = []
+            stopping = False
+            deadline = time.monotonic() + self.interval
+            while True:
+                if isinstance(item, Event):
+                    waiters.append(item)
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except Empty:
+                    break
+            if batch:
+                self._write_durably(batch)
+            for waiter in waiters:
+                waiter.set()
+            if stopping:
+                return
+
+    def _write_durably(self, records: List[Record]) -> None:
+        delay = self.retry_backoff
+        while True:
+            try:
+                self._write(records)
+                return
+            except Exception as exc:
+                if self.retryable(exc):
+                    # Busy/locked (for example another worker holding the write
+                    # lock past its retries): the rows are fine, so try again later.
+                    logger.warning('Audit log flush of %d rows failed; retrying in %.2fs', len(records), delay)
+                    with self._metrics_lock:
+                        self._retries += 1
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+                    continue
+                if len(records) == 1:
+                    logger.exception('Audit record for session %s cannot be written; dropped', records[0][1][0])
+                    with self._metrics_lock:
+                        self._rows_dropped += 1
+                    return
+                # Write the rest one by one so a single bad record cannot take the batch with it.
+                for record in records:
+                    self._write_durably([record])
+                return
+
+    def _write(self, records: List[Record]) -> None:
+        started = time.perf_counter()
+        actions: List[Tuple] = []
+        trials: List[Tuple] = []
+        for kind, row in records:
+            if kind == ACTION:
+                session_id, action_type, payload, created_at, snapshot = row
+                actions.append(
+                    (session_id, action_type, json.dumps(payload, default=json_default), created_at, snapshot)
+                )
+            else:
+                session_id, scope, n, counts, freqs, created_at = row
+                trials.append((session_id, scope, n, json.dumps(counts), json.dumps(freqs), created_at))
+        self._writer(actions, trials)
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._metrics_lock:
+            self._rows_written += len(records)
+            self._batches += 1
+            self._last_flush_ms = elapsed
+            self._max_flush_ms = max(self._max_flush_ms, elapsed)
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedSession:
+    vector: np.ndarray
+    collapsed: Dict[str, bool]
+    last_measurement: Dict[str, Optional[int]]
+    updated_at: str
+    version: int = 0
+    dirty: bool = False
+    touched: float = field(default_factory=time.monotonic)
+
+
+Writer = Callable[[List[Tuple[str, CachedSession]]], None]
+
+
+class SessionCache:
+    """LRU of decoded session state bounded by entry count and total vector bytes, with TTL eviction.
+
+    Dirty entries (write-back mode) are handed to ``writer`` when they are
+    flushed or evicted, so nothing is dropped without being persisted.
+    """
+
+    def __init__(self, capacity: int, ttl: float, writer: Writer, max_bytes: Optional[int] = None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._writer = writer
+        self._entries: "OrderedDict[str, CachedSession]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self._stop = Event()
+        self._flusher: Optional[Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def _pop(self, session_id: str) -> Optional[CachedSession]:
+        # Callers hold the lock.
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.vector.nbytes
+        return entry
+
+    def _over_budget(self) -> bool:
+        return len(self._entries) > self.capacity or (self.max_bytes is not None and self._bytes > self.max_bytes)
+
+    def get(self, session_id: str) -> Optional[CachedSession]:
+        now = time.monotonic()
+        evicted: List[Tuple[str, CachedSession]] = []
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if now - entry.touched > self.ttl:
+                self._pop(session_id)
+                if entry.dirty:
+                    evicted.append((session_id, entry))
+                entry = None
+            else:
+                entry.touched = now
+                self._entries.move_to_end(session_id)
+        if evicted:
+            self._writer(evicted)
+        return entry
+
+    def put(self, session_id: str, entry: CachedSession, expected: Optional[int] = None) -> bool:
+        # Never replace a newer version; with ``expected`` this is a compare-and-swap.
+        entry.vector.setflags(write=False)
+        evicted: List[Tuple[str, CachedSession]] = []
+        with self._lock:
+            current = self._entries.get(session_id)
+            if current is not None:
+                if expected is not None and current.version != expected:
+                    return False
+                if current.version > entry.version:
+                    return False
+            self._pop(session_id)
+            self._entries[session_id] = entry
+            self._bytes += entry.vector.nbytes
+            # An entry larger than the whole byte budget is evicted (and written, if dirty) right away.
+            while self._entries and self._over_budget():
+                evicted_id, evicted_entry = self._entries.popitem(last=False)
+                self._bytes -= evicted_entry.vector.nbytes
+                if evicted_entry.dirty:
+                    evicted.append((evicted_id, evicted_entry))
+        if evicted:
+            self._writer(evicted)
+        return True
+
+    def expire(self) -> int:
+        # Lookups only expire the entry they touch; this drops every idle one, writing dirty entries first.
+        now = time.monotonic()
+        expired: List[Tuple[str, CachedSession]] = []
+        with self._lock:
+            for session_id, entry in list(self._entries.items()):
+                if now - entry.touched > self.ttl:
+                    self._pop(session_id)
+                    expired.append((session_id, entry))
+        dirty = [(session_id, entry) for session_id, entry in expired if entry.dirty]
+        if dirty:
+            self._writer(dirty)
+        return len(expired)
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._pop(session_id)
+
+    def flush(self) -> int:
+        now = time.monotonic()
+        pending: List[Tuple[str, CachedSession]] = []
+        with self._lock:
+            for session_id, entry in list(self._entries.items()):
+                expired = now - entry.touched > self.ttl
+                if entry.dirty:
+                    pending.append((session_id, entry))
+                    entry.dirty = False
+                if expired:
+                    self._pop(session_id)
+        if pending:
+            try:
+                self._writer(pending)
+            except Exception:
+                with self._lock:
+                    for session_id, entry in pending:
+                        if self._entries.get(session_id) is entry:
+                            entry.dirty = True
+                raise
+        return len(pending)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def start(self, interval: float) -> None:
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        self._stop.clear()
+        self._flusher = Thread(target=self._run, args=(interval,), name='session-cache-flusher', daemon=True)
+        self._flusher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Session cache flush failed')
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import compiler, quantum
+from .models import CircuitOperation
+from .rng import Generator
+from .utils import qubit_labels
+
+Outcome = Dict[str, Optional[int]]
+
+
+@dataclass
+class CircuitState:
+    vector: np.ndarray
+    collapsed: Dict[str, bool]
+    last_measurement: Dict[str, Optional[int]]
+    version: Optional[int] = None
+
+    @property
+    def labels(self):
+        return qubit_labels(quantum.num_qubits(self.vector))
+
+
+def _after_gates(state: CircuitState) -> None:
+    state.collapsed = {label: False for label in state.labels}
+    state.last_measurement = {label: None for label in state.labels}
+
+
+def _after_measure(state: CircuitState, qubit: str, result: int) -> Outcome:
+    labels = state.labels
+    outcome = {label: state.last_measurement.get(label) for label in labels}
+    outcome[qubit] = result
+    state.collapsed = {label: label == qubit for label in labels}
+    state.last_measurement = {label: None for label in labels}
+    state.last_measurement[qubit] = result
+    return outcome
+
+
+def _after_measure_all(state: CircuitState, outcome: Dict[str, int]) -> Outcome:
+    state.collapsed = {label: True for label in state.labels}
+    state.last_measurement = dict(outcome)
+    return dict(outcome)
+
+
+def _after_reset(state: CircuitState, qubit: str) -> None:
+    _after_gates(state)
+    state.last_measurement[qubit] = 0
+
+
+def _after_hard_reset(state: CircuitState) -> None:
+    state.collapsed = {label: False for label in state.labels}
+    state.last_measurement = {label: 0 for label in state.labels}
+
+
+def apply_operation(state: CircuitState, operation: CircuitOperation, rng: Generator) -> Optional[Outcome]:
+    if operation.type == 'gate':
+        state.vector = quantum.apply_gate_to_state(state.vector, operation.gate, operation.qubits, operation.theta)
+        _after_gates(state)
+        return None
+    if operation.type == 'measure':
+        if operation.qubit in ('BOTH', 'ALL'):
+            outcome, state.vector = quantum.measure_all(state.vector, rng)
+            return _after_measure_all(state, outcome)
+        result, state.vector = quantum.measure_qubit(state.vector, operation.qubit, rng)
+        return _after_measure(state, operation.qubit, result)
+    if operation.type == 'reset':
+        state.vector = quantum.reset_qubit(state.vector, operation.qubit)
+        _after_reset(state, operation.qubit)
+        return None
+    if operation.type == 'hard_reset':
+        state.vector = quantum.hard_reset(len(state.labels))
+        _after_hard_reset(state)
+        return None
+    raise ValueError(f'Unsupported operation: {operation.type}')
+
+
+def action_log_entry(
+    state: CircuitState, operation: CircuitOperation, outcome: Optional[Outcome]
+) -> Tuple[str, Dict[str, Any]]:
+    if operation.type == 'gate':
+        payload = {'gate': operation.gate, 'qubits': operation.qubits, 'state': state.vector}
+        if operation.theta is not None:
+            payload['theta'] = operation.theta
+        return 'GATE', payload
+    if operation.type == 'measure':
+        return 'MEASURE', {'scope': operation.qubit, 'outcome': outcome}
+    if operation.type == 'reset':
+        return 'RESET', {'qubit': operation.qubit}
+    return 'HARD_RESET', {}
+
+
+def _apply_gate_run(state: CircuitState, operations: Sequence[CircuitOperation]) -> None:
+    count = quantum.num_qubits(state.vector)
+    gates = [
+        (operation.gate, quantum.gate_qubits(operation.gate, operation.qubits, count), operation.theta)
+        for operation in operations
+    ]
+    state.vector = compiler.run_gates(state.vector, gates)
+    _after_gates(state)
+
+
+def run_circuit(state: CircuitState, operations: Sequence[CircuitOperation], rng: Generator) -> List[Outcome]:
+    outcomes: List[Outcome] = []
+    gate_run: List[CircuitOperation] = []
+    for operation in operations:
+        if operation.type == 'gate':
+            gate_run.append(operation)
+            continue
+        if gate_run:
+            _apply_gate_run(state, gate_run)
+            gate_run = []
+        outcome = apply_operation(state, operation, rng)
+        if outcome is not None:
+            outcomes.append(outcome)
+    if gate_run:
+        _apply_gate_run(state, gate_run)
+    return outcomes
+
+
+def initial_circuit_state(count: int) -> CircuitState:
+    state = CircuitState(quantum.initial_state(count), {}, {})
+    _after_gates(state)
+    return state
+
+
+def _replay_operations(state: CircuitState, operations: Sequence[Dict[str, Any]], outcomes: Sequence[Outcome]) -> None:
+    # Re-applies logged operations, forcing each measurement to its recorded outcome.
+    pending = iter(outcomes)
+    gate_run: List[CircuitOperation] = []
+    for raw in operations:
+        operation = CircuitOperation.parse_obj(raw)
+        if operation.type == 'gate':
+            gate_run.append(operation)
+            continue
+        if gate_run:
+            _apply_gate_run(state, gate_run)
+            gate_run = []
+        if operation.type == 'measure':
+            outcome = next(pending)
+            if operation.qubit in ('BOTH', 'ALL'):
+                state.vector = quantum.collapse_all(len(state.labels), outcome)
+                _after_measure_all(state, outcome)
+            else:
+                state.vector = quantum.collapse_qubit(state.vector, operation.qubit, outcome[operation.qubit])
+                _after_measure(state, operation.qubit, outcome[operation.qubit])
+        elif operation.type == 'reset':
+            state.vector = quantum.reset_qubit(state.vector, operation.qubit)
+            _after_reset(state, operation.qubit)
+        else:
+            state.vector = quantum.hard_reset(len(state.labels))
+            _after_hard_reset(state)
+    if gate_run:
+        _apply_gate_run(state, gate_run)
+
+
+def _event_operations(action_type: str, payload: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Outcome]]:
+    if action_type == 'GATE':
+        operation = {'type': 'gate', 'gate': payload['gate'], 'qubits': payload.get('qubits')}
+        return [{**operation, 'theta': payload.get('theta')}], []
+    if action_type == 'MEASURE':
+        return [{'type': 'measure', 'qubit': payload['scope']}], [payload['outcome']]
+    if action_type == 'RESET':
+        return [{'type': 'reset', 'qubit': payload['qubit']}], []
+    if action_type == 'HARD_RESET':
+        return [{'type': 'hard_reset'}], []
+    if action_type == 'CIRCUIT':
+        return payload['operations'], payload['outcomes']
+    return [], []
+
+
+def replay(state: CircuitState, actions: Sequence[Tuple[str, Dict[str, Any]]]) -> None:
+    """Advance ``state`` through logged ``(action_type, payload)`` events.
+
+    Consecutive gate events are replayed as one compiled, fused run.
+    """
+    operations: List[Dict[str, Any]] = []
+    outcomes: List[Outcome] = []
+    for action_type, payload in actions:
+        events, recorded = _event_operations(action_type, payload)
+        operations.extend(events)
+        outcomes.extend(recorded)
+    _replay_operations(state, operations, outcomes)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from . import quantum
+from .config import settings
+from .utils import normalize
+
+# (name, qubits) or, for parametric gates, (name, qubits, theta).
+GateSpec = Union[Tuple[str, Tuple[int, ...]], Tuple[str, Tuple[int, ...], Optional[float]]]
+
+SELF_INVERSE = frozenset({"X", "H", "CNOT"})
+
+
+@dataclass(frozen=True)
+class FusedBlock:
+    qubits: Tuple[int, ...]
+    matrix: np.ndarray
+
+
+def cancel_inverses(gates: Sequence[GateSpec]) -> List[GateSpec]:
+    # A gate cancels against the latest surviving gate on its qubits when both
+    # are the same self-inverse gate; anything in between acts on other qubits
+    # and therefore commutes with the pair.
+    kept: List[Optional[GateSpec]] = []
+    previous: List[Dict[int, Optional[int]]] = []
+    last_on: Dict[int, Optional[int]] = {}
+    for gate in gates:
+        name, qubits = gate[0], gate[1]
+        candidates = {last_on.get(qubit) for qubit in qubits}
+        if name in SELF_INVERSE and len(candidates) == 1:
+            (index,) = candidates
+            if index is not None and kept[index] == gate:
+                kept[index] = None
+                for qubit in qubits:
+                    last_on[qubit] = previous[index][qubit]
+                continue
+        kept.append(gate)
+        previous.append({qubit: last_on.get(qubit) for qubit in qubits})
+        for qubit in qubits:
+            last_on[qubit] = len(kept) - 1
+    return [gate for gate in kept if gate is not None]
+
+
+@lru_cache(maxsize=1024)
+def _block_matrix(gates: Tuple[GateSpec, ...], width: int) -> np.ndarray:
+    size = 1 << width
+    columns = np.eye(size, dtype=np.complex128)
+    for name, qubits, *params in gates:
+        matrix = quantum.gate_matrix(name, *params)
+        columns = np.stack([quantum.apply_matrix(column, matrix, qubits) for column in columns])
+    matrix = columns.T.copy()
+    matrix.setflags(write=False)
+    return matrix
+
+
+def _fuse(gates: Sequence[GateSpec], max_width: int) -> Tuple[FusedBlock, ...]:
+    blocks: List[FusedBlock] = []
+    pending: List[GateSpec] = []
+    support: Tuple[int, ...] = ()
+
+    def close() -> None:
+        if not pending:
+            return
+        local = {qubit: position for position, qubit in enumerate(support)}
+        local_gates = tuple((gate[0], tuple(local[qubit] for qubit in gate[1]), *gate[2:]) for gate in pending)
+        blocks.append(FusedBlock(support, _block_matrix(local_gates, len(support))))
+
+    for gate in gates:
+        merged = tuple(sorted(set(support) | set(gate[1])))
+        if pending and len(merged) > max(max_width, len(gate[1])):
+            close()
+            pending, merged = [], tuple(sorted(gate[1]))
+        pending.append(gate)
+        support = merged
+    close()
+    return tuple(blocks)
+
+
+@lru_cache(maxsize=256)
+def _compile(gates: Tuple[GateSpec, ...], max_width: int) -> Tuple[FusedBlock, ...]:
+    return _fuse(cancel_inverses(gates), max_width)
+
+
+def compile_gates(gates: Sequence[GateSpec]) -> Tuple[FusedBlock, ...]:
+    return _compile(tuple(gates), settings.fusion_max_qubits)
+
+
+def apply_compiled(state: np.ndarray, blocks: Sequence[FusedBlock]) -> np.ndarray:
+    result = state
+    for block in blocks:
+        result = quantum.apply_matrix(result, block.matrix, block.qubits)
+    return normalize(result)
+
+
+def run_gates(state: np.ndarray, gates: Sequence[GateSpec]) -> np.ndarray:
+    return apply_compiled(state, compile_gates(gates))
@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import circuit, noise, quantum
+from .circuit import CircuitState, Outcome
+from .config import settings
+from .models import CircuitOperation
+from .noise import NoiseModel
+from .rng import Generator, spawn
+
+logger = logging.getLogger(__name__)
+
+Trials = Tuple[Dict[str, int], Dict[str, float]]
+
+
+class ComputeOverloaded(RuntimeError):
+    pass
+
+
+class ComputeTimeout(RuntimeError):
+    pass
+
+
+class ComputeUnavailable(ComputeOverloaded):
+    # A worker died (e.g. OOM-killed); the pool has been replaced and the request may be retried.
+    pass
+
+
+def _attach(name: str, size: int) -> Tuple[SharedMemory, np.ndarray]:
+    block = SharedMemory(name=name)
+    return block, np.ndarray((size,), dtype=np.complex128, buffer=block.buf)
+
+
+def _trials_task(name: str, size: int, scope: str, n: int, rng: Generator, readout_error: float) -> Trials:
+    block, vector = _attach(name, size)
+    try:
+        return quantum.run_trials(vector, scope, n, rng, readout_error)
+    finally:
+        del vector
+        block.close()
+
+
+def _noisy_trials_task(
+    name: str,
+    size: int,
+    operations: Sequence[CircuitOperation],
+    scope: str,
+    n: int,
+    model: NoiseModel,
+    rng: Generator,
+) -> Trials:
+    block, vector = _attach(name, size)
+    try:
+        return noise.run_trials(vector, operations, scope, n, model, rng)
+    finally:
+        del vector
+        block.close()
+
+
+def _circuit_task(
+    name: str,
+    size: int,
+    collapsed: Dict[str, bool],
+    last_measurement: Dict[str, Optional[int]],
+    operations: Sequence[CircuitOperation],
+    rng: Generator,
+    trials: Optional[int],
+    trials_scope: str,
+    readout_error: float,
+) -> Tuple[Dict[str, bool], Dict[str, Optional[int]], List[Outcome], Optional[Trials]]:
+    block, vector = _attach(name, size)
+    try:
+        state = CircuitState(vector.copy(), collapsed, last_measurement)
+        outcomes = circuit.run_circuit(state, operations, rng)
+        result = None
+        if trials is not None:
+            result = quantum.run_trials(state.vector, trials_scope, trials, rng, readout_error)
+        # The final vector goes back through the same shared block instead of a pickle.
+        vector[:] = state.vector
+        return state.collapsed, state.last_measurement, outcomes, result
+    finally:
+        del vector
+        block.close()
+
+
+class ComputeExecutor:
+    """Process pool for CPU-heavy simulation work.
+
+    State vectors travel through shared memory; only small arguments and
+    results are pickled. At most ``max_pending`` tasks may be queued or
+    running, further submissions fail fast with :class:`ComputeOverloaded`.
+    """
+
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._restarts = 0
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def start(self) -> None:
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._new_pool()
+
+    def stop(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    @property
+    def running(self) -> bool:
+        return self._pool is not None
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    def _replace(self, broken: ProcessPoolExecutor) -> ComputeUnavailable:
+        # Only the first caller to see a broken pool swaps it; the rest find it already replaced.
+        with self._lock:
+            if self._pool is broken:
+                self._pool = self._new_pool()
+                self._restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        logger.error('Compute worker exited unexpectedly; process pool restarted')
+        return ComputeUnavailable('Compute worker exited unexpectedly')
+
+    def submit(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        return self.map(fn, [args], timeout)[0]
+
+    def map(self, fn: Callable[..., Any], calls: Sequence[Tuple], timeout: Optional[float] = None) -> List[Any]:
+        # All calls are admitted (or rejected) together and then run in parallel.
+        with self._lock:
+            if self._pool is None:
+                raise RuntimeError('Compute executor is not running')
+            if self._pending + len(calls) > self.max_pending:
+                self._rejected += 1
+                raise ComputeOverloaded('Compute queue is full')
+            self._pending += len(calls)
+            pool = self._pool
+        futures: List[Future] = []
+        try:
+            for args in calls:
+                futures.append(pool.submit(fn, *args))
+        except BrokenProcessPool:
+            raise self._replace(pool) from None
+        finally:
+            # Calls that never reached the pool give their slots back now, the rest when they finish.
+            with self._lock:
+                self._pending -= len(calls) - len(futures)
+            for future in futures:
+                future.add_done_callback(self._done)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        try:
+            return [future.result(timeout=max(deadline - time.monotonic(), 0)) for future in futures]
+        except BrokenProcessPool:
+            raise self._replace(pool) from None
+        except FutureTimeout:
+            # A task that already started keeps its worker until it finishes;
+            # its slot is only released then, so overload accounting stays honest.
+            for future in futures:
+                future.cancel()
+            with self._lock:
+                self._timeouts += 1
+            raise ComputeTimeout('Simulation timed out') from None
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'restarts': self._restarts,
+            }
+
+
+_executor = ComputeExecutor(
+    settings.compute_workers or os.cpu_count() or 1,
+    settings.compute_max_pending,
+    settings.compute_timeout,
+)
+
+
+def start() -> None:
+    if settings.compute_mode == 'process':
+        _executor.start()
+
+
+def stop() -> None:
+    _executor.stop()
+
+
+def metrics() -> Dict[str, float]:
+    return _executor.metrics()
+
+
+def _offload(work: int) -> bool:
+    return _executor.running and work >= settings.compute_min_work
+
+
+def _shared_copy(vector: np.ndarray) -> Tuple[SharedMemory, np.ndarray]:
+    block = SharedMemory(create=True, size=vector.nbytes)
+    shared = np.ndarray(vector.shape, dtype=np.complex128, buffer=block.buf)
+    shared[:] = vector
+    return block, shared
+
+
+def run_trials(vector: np.ndarray, scope: str, n: int, rng: Generator, readout_error: float = 0.0) -> Trials:
+    if not _offload(n):
+        return quantum.run_trials(vector, scope, n, rng, readout_error)
+    block, shared = _shared_copy(vector)
+    try:
+        return _executor.submit(_trials_task, block.name, vector.size, scope, n, spawn(rng), readout_error)
+    finally:
+        del shared
+        block.close()
+        block.unlink()
+
+
+def run_noisy_trials(
+    vector: np.ndarray,
+    operations: Sequence[CircuitOperation],
+    scope: str,
+    n: int,
+    model: NoiseModel,
+    rng: Generator,
+) -> Trials:
+    # Trajectories are independent, so shots are split evenly across the pool,
+    # each share with its own child generator, and the histograms summed.
+    if not _offload(n * vector.size * max(len(operations), 1)):
+        return noise.run_trials(vector, operations, scope, n, model, rng)
+    shares = [n // _executor.workers + (index < n % _executor.workers) for index in range(_executor.workers)]
+    block, shared = _shared_copy(vector)
+    try:
+        results = _executor.map(
+            _noisy_trials_task,
+            [
+                (block.name, vector.size, list(operations), scope, share, model, spawn(rng))
+                for share in shares
+                if share
+            ],
+        )
+    finally:
+        del shared
+        block.close()
+        block.unlink()
+    counts: Dict[str, int] = {}
+    for partial, _ in results:
+        for label, value in partial.items():
+            counts[label] = counts.get(label, 0) + value
+    return counts, {label: value / n for label, value in counts.items()}
+
+
+def run_circuit(
+    state: CircuitState,
+    operations: Sequence[CircuitOperation],
+    rng: Generator,
+    trials: Optional[int] = None,
+    trials_scope: str = 'ALL',
+    model: Optional[NoiseModel] = None,
+) -> Tuple[List[Outcome], Optional[Trials]]:
+    model = model or NoiseModel()
+    if trials is not None and model.gate_noise:
+        # Noisy shots are trajectories of the whole circuit from the starting
+        # state; the persisted state still follows the ideal run.
+        start = state.vector.copy()
+        outcomes, _ = run_circuit(state, operations, rng)
+        return outcomes, run_noisy_trials(start, operations, trials_scope, trials, model, rng)
+    if not _offload(len(operations) * state.vector.size + (trials or 0)):
+        outcomes = circuit.run_circuit(state, operations, rng)
+        result = None
+        if trials is not None:
+            result = quantum.run_trials(state.vector, trials_scope, trials, rng, model.readout_error)
+        return outcomes, result
+    block, shared = _shared_copy(state.vector)
+    try:
+        state.collapsed, state.last_measurement, outcomes, result = _executor.submit(
+            _circuit_task,
+            block.name,
+            state.vector.size,
+            state.collapsed,
+            state.last_measurement,
+            list(operations),
+            spawn(rng),
+            trials,
+            trials_scope,
+            model.readout_error,
+        )
+        state.vector = shared.copy()
+        return outcomes, result
+    finally:
+        del shared
+        block.close()
+        block.unlink()
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Literal, Optional
+
+from pydantic import BaseSettings, Field
+
+
+class Settings(BaseSettings):
+    db_path: Path = Path(__file__).resolve().parent.parent / 'data' / 'quantum.db'
+    db_pool: bool = True
+    db_busy_timeout_ms: int = 5000
+    db_cache_kib: int = 8192
+    db_mmap_bytes: int = 64 * 1024 * 1024
+    db_statement_cache: int = 128
+    db_write_retries: int = 5
+    db_write_backoff: float = 0.05
+    rng_backend: Literal['secure', 'philox'] = 'secure'
+    rng_seed: Optional[int] = None
+    # uvicorn's own worker count; per-session RNG overrides only live in one worker's memory.
+    web_concurrency: int = Field(1, env='WEB_CONCURRENCY')
+    session_cache_mode: Literal['off', 'write-through', 'write-back'] = 'write-through'
+    session_cache_size: int = 1024
+    session_cache_bytes: int = 256 * 1024 * 1024
+    session_cache_ttl: float = 300.0
+    session_cache_flush_interval: float = 1.0
+    fusion_max_qubits: int = 3
+    sweep_max_amplitudes: int = 1 << 24
+    noise_depolarizing: float = 0.0
+    noise_amplitude_damping: float = 0.0
+    noise_readout_error: float = 0.0
+    noise_batch_amplitudes: int = 1 << 22
+    trials_stream_every: int = 1 << 16
+    compute_mode: Literal['process', 'inline'] = 'process'
+    compute_workers: int = 0
+    compute_max_pending: int = 64
+    compute_timeout: float = 60.0
+    compute_min_work: int = 1 << 22
+    jobs_workers: int = 2
+    jobs_max_active: int = 100
+    jobs_retention_seconds: float = 86400.0
+    jobs_max_finished: int = 1000
+    retention_interval: float = 300.0
+    retention_session_ttl: float = 30 * 24 * 3600.0
+    retention_history_ttl: float = 0.0
+    retention_batch_size: int = 500
+    retention_vacuum_pages: int = 1000
+    retention_convert_vacuum: bool = False
+    retention_archive_dir: Optional[Path] = None
+    audit_mode: Literal['sync', 'async'] = 'async'
+    action_log_mode: Literal['full', 'events'] = 'full'
+    snapshot_interval: int = 50
+    audit_batch_size: int = 500
+    audit_flush_interval: float = 0.05
+    audit_max_queue: int = 10000
+    audit_enqueue_timeout: float = 1.0
+
+    class Config:
+        env_prefix = 'QUANTUM_'
+        env_file = '.env'
+
+
+settings = Settings()
@@ -1,122 +1,793 @@
 from __future__ import annotations
 
 import json
+import os
+import socket
 import sqlite3
+import time
 import uuid
+import weakref
+from contextlib import contextmanager
 from datetime import UTC, datetime
 from pathlib import Path
-from threading import Lock
-from typing import Dict, Optional, Tuple
+from threading import Lock, local
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
 import numpy as np
 
 from . import quantum
+from .audit import AuditLogWriter
+from .cache import CachedSession, SessionCache
+from .config import settings
 from .models import QuantumStateModel, SessionResponse
-from .utils import deserialize_state, serialize_state, vector_to_dict
+from .utils import decode_state, encode_state, json_default, qubit_labels, vector_to_dict
 
-DB_PATH = Path(__file__).resolve().parent.parent / 'data' / 'quantum.db'
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+SCHEMA_VERSION = 3
+MIGRATION_BATCH_SIZE = 500
 
-_DB_LOCK = Lock()
+_POOL_LOCK = Lock()
 
+_local = local()
+_pool: List[sqlite3.Connection] = []
+_generation = 0
 
-def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# Identifies this worker process in the jobs table.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SessionConflict(RuntimeError):
+    """A session row changed between being read and being written back."""
+
+
+class JobNotRunning(RuntimeError):
+    """A job left the running state (e.g. was cancelled) before its result was committed."""
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(
+        path,
+        check_same_thread=False,
+        cached_statements=settings.db_statement_cache,
+        isolation_level=None,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA busy_timeout = {int(settings.db_busy_timeout_ms)}")
+    conn.execute(f"PRAGMA cache_size = {-int(settings.db_cache_kib)}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings.db_mmap_bytes)}")
+    # Only takes effect on a fresh database; existing files are converted by enable_incremental_vacuum().
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    return conn
+
+
+class _Holder:
+    # Thread-local owner of a pooled connection; dropped with the thread's locals when it exits.
+    def __init__(self, key: Tuple[Path, int], conn: sqlite3.Connection) -> None:
+        self.key = key
+        self.conn = conn
+
+
+def _release(conn: sqlite3.Connection) -> None:
+    with _POOL_LOCK:
+        if conn in _pool:
+            _pool.remove(conn)
+    conn.close()
+
+
+def get_connection() -> sqlite3.Connection:
+    path = Path(settings.db_path)
+    if not settings.db_pool:
+        return _connect(path)
+    cached = getattr(_local, 'connection', None)
+    if cached is not None and cached.key == (path, _generation):
+        return cached.conn
+    conn = _connect(path)
+    holder = _Holder((path, _generation), conn)
+    # Worker threads come and go (AnyIO retires idle ones), so close each connection with its thread.
+    weakref.finalize(holder, _release, conn)
+    with _POOL_LOCK:
+        _pool.append(conn)
+        _local.connection = holder
     return conn
 
 
+def _busy(exc: sqlite3.OperationalError) -> bool:
+    message = str(exc)
+    return 'locked' in message or 'busy' in message
+
+
+@contextmanager
+def _write() -> Iterator[sqlite3.Connection]:
+    # Connections run in autocommit mode, so reads never hold a transaction open.
+    # Writers take SQLite's reserved lock up front with BEGIN IMMEDIATE; busy_timeout
+    # covers short waits and the retries back off when another process holds it longer.
+    conn = get_connection()
+    for attempt in range(settings.db_write_retries + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as exc:
+            if not _busy(exc) or attempt == settings.db_write_retries:
+                raise
+            time.sleep(settings.db_write_backoff * (1 << attempt))
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def close_connections() -> None:
+    global _generation
+    with _POOL_LOCK:
+        connections = list(_pool)
+        _pool.clear()
+        _generation += 1
+    for conn in connections:
+        conn.close()
+
+
 def init_db() -> None:
-    with _DB_LOCK:
-        with get_connection() as conn:
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id TEXT PRIMARY KEY,
-                    vector TEXT NOT NULL,
-                    collapsed_q1 INTEGER NOT NULL,
-                    collapsed_q2 INTEGER NOT NULL,
-                    last_measurement_q1 INTEGER,
-                    last_measurement_q2 INTEGER,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL
-                )
-                """
+    with _write() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                collapsed_q1 INTEGER NOT NULL,
+                collapsed_q2 INTEGER NOT NULL,
+                last_measurement_q1 INTEGER,
+                last_measurement_q2 INTEGER,
+                flags TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
             )
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS actions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    action_type TEXT NOT NULL,
-                    payload TEXT,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY(session_id) REFERENCES sessions(id)
-                )
-                """
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS actions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                action_type TEXT NOT NULL,
+                payload TEXT,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY(session_id) REFERENCES sessions(id)
             )
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS trials (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    scope TEXT NOT NULL,
-                    n INTEGER NOT NULL,
-                    counts TEXT NOT NULL,
-                    freqs TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY(session_id) REFERENCES sessions(id)
-                )
-                """
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trials (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                scope TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                counts TEXT NOT NULL,
+                freqs TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY(session_id) REFERENCES sessions(id)
             )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                FOREIGN KEY(session_id) REFERENCES sessions(id)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                action_id INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                flags TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY(session_id) REFERENCES sessions(id)
+            )
+            """
+        )
+        _migrate(conn)
+        for statement in _INDEXES:
+            conn.execute(statement)
+
+
+# History reads page by (session_id, id) so every page is one index range scan.
+_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_actions_session ON actions (session_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_actions_session_type ON actions (session_id, action_type, id)",
+    "CREATE INDEX IF NOT EXISTS idx_actions_created ON actions (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_trials_session ON trials (session_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_trials_session_scope ON trials (session_id, scope, id)",
+    "CREATE INDEX IF NOT EXISTS idx_trials_created ON trials (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_snapshots_session ON snapshots (session_id, action_id)",
+)
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        _migrate_binary_vectors(conn)
+    if version < 2:
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if 'flags' not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN flags TEXT")
+    if version < 3:
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if 'version' not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if 'owner' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+    if version < SCHEMA_VERSION:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _migrate_binary_vectors(conn: sqlite3.Connection) -> None:
+    while True:
+        rows = conn.execute(
+            "SELECT id, vector FROM sessions WHERE typeof(vector) = 'text' LIMIT ?",
+            (MIGRATION_BATCH_SIZE,),
+        ).fetchall()
+        if not rows:
+            return
+        conn.executemany(
+            "UPDATE sessions SET vector = ? WHERE id = ?",
+            [(encode_state(decode_state(row['vector'])), row['id']) for row in rows],
+        )
+
+
+_UPDATE_SESSION_SQL = """
+    UPDATE sessions
+    SET vector = ?,
+        collapsed_q1 = ?,
+        collapsed_q2 = ?,
+        last_measurement_q1 = ?,
+        last_measurement_q2 = ?,
+        flags = ?,
+        updated_at = ?,
+        version = ?
+    WHERE id = ?
+"""
+# Optimistic concurrency: the write only lands if nobody bumped the version since it was read.
+_UPDATE_SESSION_CHECKED_SQL = _UPDATE_SESSION_SQL + " AND version = ?"
+_INSERT_ACTION_SQL = "INSERT INTO actions (session_id, action_type, payload, created_at) VALUES (?, ?, ?, ?)"
+_INSERT_SNAPSHOT_SQL = """
+    INSERT INTO snapshots (session_id, action_id, vector, flags, created_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+_INSERT_TRIALS_SQL = """
+    INSERT INTO trials (session_id, scope, n, counts, freqs, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def _flag_columns(collapsed: Dict[str, bool], last_measurement: Dict[str, Optional[int]]) -> Tuple:
+    # Q1/Q2 keep their legacy columns; the flags document covers every qubit.
+    return (
+        int(collapsed.get('Q1', False)),
+        int(collapsed.get('Q2', False)),
+        last_measurement.get('Q1'),
+        last_measurement.get('Q2'),
+        json.dumps({'collapsed': collapsed, 'last_measurement': last_measurement}),
+    )
+
+
+def _session_rows(entries: List[Tuple[str, CachedSession]]) -> List[Tuple]:
+    return [
+        (
+            encode_state(entry.vector),
+            *_flag_columns(entry.collapsed, entry.last_measurement),
+            entry.updated_at,
+            entry.version,
+            session_id,
+        )
+        for session_id, entry in entries
+    ]
 
 
-def _state_model_from_row(row: sqlite3.Row) -> QuantumStateModel:
-    vector = deserialize_state(row['vector'])
-    state = QuantumStateModel(
+def _write_sessions(entries: List[Tuple[str, CachedSession]]) -> None:
+    rows = _session_rows(entries)
+    with _write() as conn:
+        conn.executemany(_UPDATE_SESSION_SQL, rows)
+
+
+_cache = SessionCache(
+    settings.session_cache_size, settings.session_cache_ttl, _write_sessions, settings.session_cache_bytes
+)
+
+
+def start_cache() -> None:
+    if settings.session_cache_mode == 'write-back':
+        _cache.start(settings.session_cache_flush_interval)
+
+
+def flush_cache() -> int:
+    return _cache.flush()
+
+
+def stop_cache() -> None:
+    _cache.stop()
+
+
+def _insert_actions(conn: sqlite3.Connection, actions: List[Tuple]) -> None:
+    # Rows are (session_id, action_type, payload_json, created_at, snapshot). A snapshot
+    # needs its action's id, so those rows are inserted one by one and the plain rows
+    # around them in order-preserving runs.
+    run: List[Tuple] = []
+    for *row, snapshot in actions:
+        if snapshot is None:
+            run.append(tuple(row))
+            continue
+        if run:
+            conn.executemany(_INSERT_ACTION_SQL, run)
+            run = []
+        action_id = conn.execute(_INSERT_ACTION_SQL, row).lastrowid
+        vector, collapsed, last_measurement = snapshot
+        conn.execute(
+            _INSERT_SNAPSHOT_SQL,
+            (
+                row[0],
+                action_id,
+                encode_state(vector),
+                json.dumps({'collapsed': collapsed, 'last_measurement': last_measurement}),
+                row[3],
+            ),
+        )
+    if run:
+        conn.executemany(_INSERT_ACTION_SQL, run)
+
+
+def _write_audit_rows(actions: List[Tuple], trials: List[Tuple]) -> None:
+    with _write() as conn:
+        if actions:
+            _insert_actions(conn, actions)
+        if trials:
+            conn.executemany(_INSERT_TRIALS_SQL, trials)
+
+
+_audit_log = AuditLogWriter(
+    _write_audit_rows,
+    batch_size=settings.audit_batch_size,
+    interval=settings.audit_flush_interval,
+    max_queue=settings.audit_max_queue,
+    enqueue_timeout=settings.audit_enqueue_timeout,
+    retryable=lambda exc: isinstance(exc, sqlite3.OperationalError) and _busy(exc),
+    retry_backoff=settings.db_write_backoff,
+)
+
+
+def start_audit_log() -> None:
+    if settings.audit_mode == 'async':
+        _audit_log.start()
+
+
+def flush_audit_log(timeout: Optional[float] = None) -> bool:
+    return _audit_log.flush(timeout)
+
+
+def stop_audit_log() -> None:
+    _audit_log.stop()
+
+
+def audit_log_metrics() -> Dict[str, float]:
+    return _audit_log.metrics()
+
+
+def _state_model(
+    vector: np.ndarray,
+    collapsed: Dict[str, bool],
+    last_measurement: Dict[str, Optional[int]],
+    version: int = 0,
+) -> QuantumStateModel:
+    return QuantumStateModel(
+        num_qubits=quantum.num_qubits(vector),
         vector=vector_to_dict(vector),
-        collapsed={'Q1': bool(row['collapsed_q1']), 'Q2': bool(row['collapsed_q2'])},
-        last_measurement={'Q1': row['last_measurement_q1'], 'Q2': row['last_measurement_q2']},
+        collapsed=dict(collapsed),
+        last_measurement=dict(last_measurement),
+        version=version,
+    )
+
+
+def _entry_from_row(row: sqlite3.Row) -> CachedSession:
+    if row['flags']:
+        flags = json.loads(row['flags'])
+        collapsed, last_measurement = flags['collapsed'], flags['last_measurement']
+    else:
+        collapsed = {'Q1': bool(row['collapsed_q1']), 'Q2': bool(row['collapsed_q2'])}
+        last_measurement = {'Q1': row['last_measurement_q1'], 'Q2': row['last_measurement_q2']}
+    return CachedSession(
+        vector=decode_state(row['vector']),
+        collapsed=collapsed,
+        last_measurement=last_measurement,
+        updated_at=row['updated_at'],
+        version=row['version'],
     )
-    return state
 
 
-def create_session() -> SessionResponse:
+def _create_payload(state_model: QuantumStateModel) -> Dict:
+    if settings.action_log_mode == 'events':
+        return {'num_qubits': state_model.num_qubits}
+    return {'num_qubits': state_model.num_qubits, 'state': state_model.dict()}
+
+
+def create_session(num_qubits: int = 2) -> SessionResponse:
     session_id = str(uuid.uuid4())
-    vector = quantum.initial_state()
-    state_model = QuantumStateModel(
-        vector=vector_to_dict(vector),
-        collapsed={'Q1': False, 'Q2': False},
-        last_measurement={'Q1': None, 'Q2': None},
+    vector = quantum.initial_state(num_qubits)
+    labels = qubit_labels(num_qubits)
+    state_model = _state_model(
+        vector,
+        {label: False for label in labels},
+        {label: None for label in labels},
     )
     now = datetime.now(UTC).isoformat()
-    payload = serialize_state(vector)
-    with _DB_LOCK:
-        with get_connection() as conn:
-            conn.execute(
-                """
-                INSERT INTO sessions (
-                    id, vector, collapsed_q1, collapsed_q2, last_measurement_q1, last_measurement_q2, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (session_id, payload, 0, 0, None, None, now, now),
-            )
-            conn.execute(
-                "INSERT INTO actions (session_id, action_type, payload, created_at) VALUES (?, ?, ?, ?)",
-                (session_id, 'SESSION_CREATE', json.dumps({'state': state_model.dict()}), now),
-            )
+    payload = encode_state(vector)
+    with _write() as conn:
+        conn.execute(
+            """
+            INSERT INTO sessions (
+                id, vector, collapsed_q1, collapsed_q2, last_measurement_q1, last_measurement_q2, flags,
+                created_at, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                session_id,
+                payload,
+                *_flag_columns(state_model.collapsed, state_model.last_measurement),
+                now,
+                now,
+            ),
+        )
+        conn.execute(
+            _INSERT_ACTION_SQL,
+            (session_id, 'SESSION_CREATE', json.dumps(_create_payload(state_model)), now),
+        )
+    if settings.session_cache_mode != 'off':
+        _cache.put(
+            session_id,
+            CachedSession(
+                vector=vector,
+                collapsed=dict(state_model.collapsed),
+                last_measurement=dict(state_model.last_measurement),
+                updated_at=now,
+            ),
+        )
     return SessionResponse(session_id=session_id, state=state_model)
 
 
+_VERSION_SQL = "SELECT version FROM sessions WHERE id = ?"
+
+
+def _cached_entry(session_id: str) -> Optional[CachedSession]:
+    if settings.session_cache_mode == 'off':
+        return None
+    entry = _cache.get(session_id)
+    if entry is None or settings.session_cache_mode == 'write-back':
+        return entry
+    # Another worker may have written the row since it was cached; one
+    # primary-key version lookup tells whether the cached copy is current.
+    row = get_connection().execute(_VERSION_SQL, (session_id,)).fetchone()
+    if row is None or row['version'] != entry.version:
+        _cache.discard(session_id)
+        return None
+    return entry
+
+
 def fetch_session(session_id: str) -> Tuple[np.ndarray, QuantumStateModel]:
-    with _DB_LOCK:
-        with get_connection() as conn:
-            row = conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    entry = _cached_entry(session_id)
+    if entry is None:
+        row = get_connection().execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            raise KeyError("Session not found")
+        entry = _entry_from_row(row)
+        if settings.session_cache_mode != 'off':
+            _cache.put(session_id, entry)
+    return entry.vector, _state_model(entry.vector, entry.collapsed, entry.last_measurement, entry.version)
+
+
+BULK_FETCH_CHUNK = 500
+
+
+def fetch_sessions(session_ids: Sequence[str]) -> Dict[str, Tuple[np.ndarray, QuantumStateModel]]:
+    # Cached sessions are served from memory; the rest come back in one IN (...) query per chunk.
+    entries: Dict[str, CachedSession] = {}
+    misses: List[str] = []
+    for session_id in dict.fromkeys(session_ids):
+        entry = _cache.get(session_id) if settings.session_cache_mode != 'off' else None
+        if entry is None:
+            misses.append(session_id)
+        else:
+            entries[session_id] = entry
+    conn = get_connection()
+    if entries and settings.session_cache_mode == 'write-through':
+        cached = list(entries)
+        for start in range(0, len(cached), BULK_FETCH_CHUNK):
+            chunk = cached[start:start + BULK_FETCH_CHUNK]
+            current = dict(conn.execute(
+                f"SELECT id, version FROM sessions WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+            ).fetchall())
+            for session_id in chunk:
+                if current.get(session_id) != entries[session_id].version:
+                    del entries[session_id]
+                    _cache.discard(session_id)
+                    misses.append(session_id)
+    for start in range(0, len(misses), BULK_FETCH_CHUNK):
+        chunk = misses[start:start + BULK_FETCH_CHUNK]
+        rows = conn.execute(
+            f"SELECT * FROM sessions WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+        ).fetchall()
+        for row in rows:
+            entry = entries[row['id']] = _entry_from_row(row)
+            if settings.session_cache_mode != 'off':
+                _cache.put(row['id'], entry)
+    return {
+        session_id: (
+            entry.vector,
+            _state_model(entry.vector, entry.collapsed, entry.last_measurement, entry.version),
+        )
+        for session_id, entry in entries.items()
+    }
+
+
+def session_exists(session_id: str) -> bool:
+    if settings.session_cache_mode != 'off' and _cache.get(session_id) is not None:
+        return True
+    return get_connection().execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+
+def _page(
+    table: str, columns: str, session_id: str, filters: Dict[str, Sequence[str]], before: Optional[int], limit: int
+) -> Tuple[List[sqlite3.Row], Optional[int]]:
+    # Keyset pagination: newest first, the cursor is the last id already returned.
+    clauses = ["session_id = ?"]
+    params: List = [session_id]
+    for column, values in filters.items():
+        if values:
+            clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    if before is not None:
+        clauses.append("id < ?")
+        params.append(before)
+    rows = get_connection().execute(
+        f"SELECT {columns} FROM {table} WHERE {' AND '.join(clauses)} ORDER BY id DESC LIMIT ?",
+        (*params, limit + 1),
+    ).fetchall()
+    cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return rows[:limit], cursor
+
+
+def fetch_history(
+    session_id: str, action_types: Sequence[str] = (), before: Optional[int] = None, limit: int = 50
+) -> Tuple[List[Dict], Optional[int]]:
+    rows, cursor = _page(
+        'actions', 'id, action_type, payload, created_at', session_id, {'action_type': action_types}, before, limit
+    )
+    items = [
+        {**dict(row), 'payload': json.loads(row['payload']) if row['payload'] is not None else None} for row in rows
+    ]
+    return items, cursor
+
+
+def fetch_trials(
+    session_id: str, scopes: Sequence[str] = (), before: Optional[int] = None, limit: int = 50
+) -> Tuple[List[Dict], Optional[int]]:
+    rows, cursor = _page(
+        'trials', 'id, scope, n, counts, freqs, created_at', session_id, {'scope': scopes}, before, limit
+    )
+    items = [{**dict(row), 'counts': json.loads(row['counts']), 'freqs': json.loads(row['freqs'])} for row in rows]
+    return items, cursor
+
+
+def fetch_replay(
+    session_id: str, action_id: Optional[int] = None
+) -> Tuple[int, Optional[CachedSession], Optional[int], List[Tuple[str, Dict]]]:
+    """Return what is needed to rebuild a session as of ``action_id`` (default: latest).
+
+    That is the target id, the nearest snapshot at or before it (with its action id)
+    and the actions logged after the snapshot up to the target, oldest first.
+    """
+    conn = get_connection()
+    if action_id is None:
+        row = conn.execute("SELECT MAX(id) AS id FROM actions WHERE session_id = ?", (session_id,)).fetchone()
+    else:
+        row = conn.execute("SELECT id FROM actions WHERE id = ? AND session_id = ?", (action_id, session_id)).fetchone()
+    if row is None or row['id'] is None:
+        raise KeyError("Action not found")
+    target = row['id']
+    # A snapshot only counts while its own action is still logged. History is
+    # pruned oldest first, so every later action then still exists too.
+    snapshot_row = conn.execute(
+        """
+        SELECT snapshots.* FROM snapshots JOIN actions ON actions.id = snapshots.action_id
+        WHERE snapshots.session_id = ? AND snapshots.action_id <= ?
+        ORDER BY snapshots.action_id DESC LIMIT 1
+        """,
+        (session_id, target),
+    ).fetchone()
+    snapshot = snapshot_action = None
+    if snapshot_row is not None:
+        flags = json.loads(snapshot_row['flags'])
+        snapshot = CachedSession(
+            vector=decode_state(snapshot_row['vector']),
+            collapsed=flags['collapsed'],
+            last_measurement=flags['last_measurement'],
+            updated_at=snapshot_row['created_at'],
+        )
+        snapshot_action = snapshot_row['action_id']
+    rows = conn.execute(
+        "SELECT action_type, payload FROM actions WHERE session_id = ? AND id > ? AND id <= ? ORDER BY id",
+        (session_id, snapshot_action or 0, target),
+    ).fetchall()
+    events = [(row['action_type'], json.loads(row['payload']) if row['payload'] else {}) for row in rows]
+    return target, snapshot, snapshot_action, events
+
+
+def _current_version(session_id: str) -> int:
+    if settings.session_cache_mode == 'write-back':
+        entry = _cache.get(session_id)
+        if entry is not None:
+            return entry.version
+    row = get_connection().execute(_VERSION_SQL, (session_id,)).fetchone()
     if row is None:
         raise KeyError("Session not found")
-    state_model = _state_model_from_row(row)
-    vector = deserialize_state(row['vector'])
-    return vector, state_model
+    return row['version']
+
+
+class UnitOfWork:
+    """Stages session updates and audit rows and commits them in one transaction."""
+
+    def __init__(self) -> None:
+        self._now = datetime.now(UTC).isoformat()
+        self._sessions: Dict[str, CachedSession] = {}
+        self._actions: List[Tuple] = []
+        self._trials: List[Tuple] = []
+        self._job: Optional[Tuple[str, Dict]] = None
+
+    def stage_session(
+        self,
+        session_id: str,
+        vector: np.ndarray,
+        collapsed: Dict[str, bool],
+        last_measurement: Dict[str, Optional[int]],
+        version: Optional[int] = None,
+    ) -> CachedSession:
+        # ``version`` is the one the caller read; without it the current version is assumed.
+        if version is None:
+            version = _current_version(session_id)
+        entry = self._sessions[session_id] = CachedSession(
+            vector=vector,
+            collapsed=dict(collapsed),
+            last_measurement=dict(last_measurement),
+            updated_at=self._now,
+            version=version + 1,
+            dirty=settings.session_cache_mode == 'write-back',
+        )
+        return entry
+
+    def update_session(
+        self,
+        session_id: str,
+        vector: np.ndarray,
+        collapsed: Dict[str, bool],
+        last_measurement: Dict[str, Optional[int]],
+        version: Optional[int] = None,
+    ) -> QuantumStateModel:
+        entry = self.stage_session(session_id, vector, collapsed, last_measurement, version)
+        return _state_model(vector, collapsed, last_measurement, entry.version)
+
+    def log_action(self, session_id: str, action_type: str, payload: Dict) -> None:
+        if settings.action_log_mode == 'events':
+            # Event-sourced log: only the event and its outcome; state lives in snapshots.
+            payload = {key: value for key, value in payload.items() if key != 'state'}
+        self._actions.append((session_id, action_type, payload, self._now, None))
+
+    def log_trials(
+        self, session_id: str, scope: str, n: int, counts: Dict[str, int], freqs: Dict[str, float]
+    ) -> None:
+        self._trials.append((session_id, scope, n, counts, freqs, self._now))
+
+    def finish_job(self, job_id: str, result: Dict) -> None:
+        # Committed with the rest of the work only if the job is still running.
+        self._job = (job_id, result)
+
+    def _snapshotted_actions(self) -> List[Tuple]:
+        # In events mode every snapshot_interval-th version of a session is stored in full,
+        # attached to the last action this unit of work logs for it.
+        actions = list(self._actions)
+        if settings.action_log_mode != 'events':
+            return actions
+        last_index = {row[0]: index for index, row in enumerate(actions)}
+        for session_id, entry in self._sessions.items():
+            index = last_index.get(session_id)
+            if index is not None and entry.version % settings.snapshot_interval == 0:
+                snapshot = (entry.vector, dict(entry.collapsed), dict(entry.last_measurement))
+                actions[index] = actions[index][:4] + (snapshot,)
+        return actions
+
+    def commit(self) -> None:
+        entries = list(self._sessions.items())
+        written = [(session_id, entry) for session_id, entry in entries if not entry.dirty]
+        session_rows = [row + (entry.version - 1,) for row, (_, entry) in zip(_session_rows(written), written)]
+        job = None
+        if self._job is not None:
+            job_id, result = self._job
+            job = (json.dumps(result, default=json_default), datetime.now(UTC).isoformat(), job_id)
+            if len(written) < len(entries):
+                # Write-back sessions reach the cache outside the transaction below, so settle the job first.
+                with _write() as conn:
+                    _finish_job(conn, job)
+                job = None
+        for session_id, entry in entries:
+            # Write-back sessions are owned by this process's cache, so the version check happens there.
+            if entry.dirty and (
+                _current_version(session_id) != entry.version - 1
+                or not _cache.put(session_id, entry, expected=entry.version - 1)
+            ):
+                raise SessionConflict("Session was modified concurrently")
+        deferred = settings.audit_mode == 'async'
+        actions = [] if deferred else [
+            (session_id, action_type, json.dumps(payload, default=json_default), created_at, snapshot)
+            for session_id, action_type, payload, created_at, snapshot in self._snapshotted_actions()
+        ]
+        trials = [] if deferred else [
+            (session_id, scope, n, json.dumps(counts), json.dumps(freqs), created_at)
+            for session_id, scope, n, counts, freqs, created_at in self._trials
+        ]
+        if session_rows or actions or trials or job:
+            try:
+                with _write() as conn:
+                    if session_rows:
+                        cursor = conn.executemany(_UPDATE_SESSION_CHECKED_SQL, session_rows)
+                        if cursor.rowcount != len(session_rows):
+                            raise SessionConflict("Session was modified concurrently")
+                    if actions:
+                        _insert_actions(conn, actions)
+                    if trials:
+                        conn.executemany(_INSERT_TRIALS_SQL, trials)
+                    if job:
+                        _finish_job(conn, job)
+            except SessionConflict:
+                # Another worker moved these sessions on; drop our stale copies.
+                for session_id, _ in written:
+                    _cache.discard(session_id)
+                raise
+        if deferred:
+            for row in self._snapshotted_actions():
+                _audit_log.submit_action(*row)
+            for row in self._trials:
+                _audit_log.submit_trials(*row)
+        if settings.session_cache_mode != 'off':
+            for session_id, entry in written:
+                _cache.put(session_id, entry)
+        self._sessions.clear()
+        self._actions.clear()
+        self._trials.clear()
+        self._job = None
+
+
+@contextmanager
+def transaction() -> Iterator[UnitOfWork]:
+    work = UnitOfWork()
+    yield work
+    work.commit()
 
 
 def update_session_state(
@@ -125,56 +796,236 @@ def update_session_state(
     collapsed: Dict[str, bool],
     last_measurement: Dict[str, Optional[int]],
 ) -> QuantumStateModel:
-    now = datetime.now(UTC).isoformat()
-    payload = serialize_state(vector)
-    with _DB_LOCK:
-        with get_connection() as conn:
-            conn.execute(
-                """
-                UPDATE sessions
-                SET vector = ?,
-                    collapsed_q1 = ?,
-                    collapsed_q2 = ?,
-                    last_measurement_q1 = ?,
-                    last_measurement_q2 = ?,
-                    updated_at = ?
-                WHERE id = ?
-                """,
-                (
-                    payload,
-                    int(collapsed['Q1']),
-                    int(collapsed['Q2']),
-                    last_measurement['Q1'],
-                    last_measurement['Q2'],
-                    now,
-                    session_id,
-                ),
-            )
-    return QuantumStateModel(
-        vector=vector_to_dict(vector),
-        collapsed=collapsed,
-        last_measurement=last_measurement,
-    )
+    with transaction() as work:
+        return work.update_session(session_id, vector, collapsed, last_measurement)
 
 
 def log_action(session_id: str, action_type: str, payload: Dict) -> None:
-    now = datetime.now(UTC).isoformat()
-    with _DB_LOCK:
-        with get_connection() as conn:
-            conn.execute(
-                "INSERT INTO actions (session_id, action_type, payload, created_at) VALUES (?, ?, ?, ?)",
-                (session_id, action_type, json.dumps(payload), now),
-            )
+    with transaction() as work:
+        work.log_action(session_id, action_type, payload)
 
 
 def log_trials(session_id: str, scope: str, n: int, counts: Dict[str, int], freqs: Dict[str, float]) -> None:
+    with transaction() as work:
+        work.log_trials(session_id, scope, n, counts, freqs)
+
+
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+
+def _job_from_row(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    return job
+
+
+def create_job(session_id: str, kind: str, params: Dict) -> Dict:
+    job_id = str(uuid.uuid4())
     now = datetime.now(UTC).isoformat()
-    with _DB_LOCK:
-        with get_connection() as conn:
-            conn.execute(
-                """
-                INSERT INTO trials (session_id, scope, n, counts, freqs, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (session_id, scope, n, json.dumps(counts), json.dumps(freqs), now),
+    with _write() as conn:
+        conn.execute(
+            """
+            INSERT INTO jobs (id, session_id, kind, status, params, owner, created_at, updated_at)
+            VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)
+            """,
+            (job_id, session_id, kind, json.dumps(params), WORKER_ID, now, now),
+        )
+    return fetch_job(job_id)
+
+
+def fetch_job(job_id: str) -> Dict:
+    row = get_connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        raise KeyError("Job not found")
+    return _job_from_row(row)
+
+
+def update_job(
+    job_id: str,
+    status: Optional[str] = None,
+    progress: Optional[float] = None,
+    result: Optional[Dict] = None,
+    error: Optional[str] = None,
+    only_if: Sequence[str] = (),
+) -> bool:
+    # ``only_if`` restricts the update to jobs currently in one of those statuses,
+    # so concurrent terminal transitions (finish vs. cancel) cannot overwrite each other.
+    condition = f" AND status IN ({', '.join('?' * len(only_if))})" if only_if else ""
+    with _write() as conn:
+        cursor = conn.execute(
+            """
+            UPDATE jobs SET
+                status = COALESCE(?, status),
+                progress = COALESCE(?, progress),
+                result = COALESCE(?, result),
+                error = COALESCE(?, error),
+                owner = CASE WHEN ? = 'running' THEN ? ELSE owner END,
+                updated_at = ?
+            WHERE id = ?
+            """ + condition,
+            (
+                status,
+                progress,
+                json.dumps(result, default=json_default) if result is not None else None,
+                error,
+                status,
+                WORKER_ID,
+                datetime.now(UTC).isoformat(),
+                job_id,
+                *only_if,
+            ),
+        )
+    return cursor.rowcount > 0
+
+
+def _finish_job(conn: sqlite3.Connection, job: Tuple[str, str, str]) -> None:
+    cursor = conn.execute(
+        "UPDATE jobs SET status = 'succeeded', progress = 1.0, result = ?, updated_at = ? "
+        "WHERE id = ? AND status = 'running'",
+        job,
+    )
+    if cursor.rowcount != 1:
+        raise JobNotRunning("Job is no longer running")
+
+
+def _owner_gone(owner: Optional[str], status: str) -> bool:
+    if owner is None:
+        # Rows from before owners were recorded: a queued one may still be
+        # picked up, a running one belonged to a server that has since restarted.
+        return status == 'running'
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname():
+        return not host
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def interrupt_jobs() -> int:
+    # Jobs run in the worker process that accepted them, so active jobs whose
+    # owner on this host has exited were lost with it.
+    rows = get_connection().execute(
+        "SELECT id, status, owner FROM jobs WHERE status IN (?, ?)", JOB_ACTIVE_STATUSES
+    ).fetchall()
+    lost = [(datetime.now(UTC).isoformat(), row['id']) for row in rows if _owner_gone(row['owner'], row['status'])]
+    if lost:
+        with _write() as conn:
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted by server restart', updated_at = ? "
+                "WHERE id = ? AND status IN (?, ?)",
+                [row + JOB_ACTIVE_STATUSES for row in lost],
+            )
+    return len(lost)
+
+
+def purge_jobs(max_age_seconds: float, max_finished: int) -> int:
+    cutoff = datetime.fromtimestamp(datetime.now(UTC).timestamp() - max_age_seconds, UTC).isoformat()
+    with _write() as conn:
+        cursor = conn.execute(
+            """
+            DELETE FROM jobs WHERE status NOT IN (?, ?) AND (
+                updated_at < ? OR id NOT IN (
+                    SELECT id FROM jobs WHERE status NOT IN (?, ?) ORDER BY updated_at DESC LIMIT ?
+                )
             )
+            """,
+            (*JOB_ACTIVE_STATUSES, cutoff, *JOB_ACTIVE_STATUSES, max_finished),
+        )
+    return cursor.rowcount
+
+
+HISTORY_TABLES = ('actions', 'trials')
+
+Archiver = Callable[[str, List[Dict]], None]
+
+
+def delete_idle_sessions(cutoff: str, limit: int) -> List[str]:
+    # Cache entries idle past their TTL are dropped (and written, if dirty) first; sessions still
+    # cached after that were used recently and are skipped. The updated_at guard on the DELETE
+    # protects sessions touched after they were selected.
+    _cache.expire()
+    rows = get_connection().execute(
+        "SELECT id FROM sessions WHERE updated_at < ? ORDER BY updated_at LIMIT ?", (cutoff, limit)
+    ).fetchall()
+    candidates = [(row['id'], cutoff) for row in rows if row['id'] not in _cache]
+    if not candidates:
+        return []
+    deleted: List[str] = []
+    with _write() as conn:
+        for candidate in candidates:
+            if conn.execute("DELETE FROM sessions WHERE id = ? AND updated_at < ? RETURNING id", candidate).fetchone():
+                deleted.append(candidate[0])
+        if deleted:
+            placeholders = ', '.join('?' for _ in deleted)
+            conn.execute(f"DELETE FROM jobs WHERE session_id IN ({placeholders})", deleted)
+            conn.execute(f"DELETE FROM snapshots WHERE session_id IN ({placeholders})", deleted)
+    for session_id in deleted:
+        _cache.discard(session_id)
+    return deleted
+
+
+def delete_history(
+    table: str,
+    limit: int,
+    session_ids: Sequence[str] = (),
+    before: Optional[str] = None,
+    archive: Optional[Archiver] = None,
+) -> int:
+    # Deletes one batch of actions/trials rows, either belonging to ``session_ids`` or created
+    # before ``before``. Rows are archived inside the same transaction, so a failed export keeps them.
+    if table not in HISTORY_TABLES:
+        raise ValueError(f"Unsupported history table: {table}")
+    if session_ids:
+        condition = f"session_id IN ({', '.join('?' for _ in session_ids)})"
+        params: List = list(session_ids)
+    elif before is not None:
+        condition = "created_at < ?"
+        params = [before]
+    else:
+        return 0
+    with _write() as conn:
+        # Oldest first, so a session's surviving actions always form an unbroken suffix.
+        rows = conn.execute(
+            f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE {condition} ORDER BY id LIMIT ?) "
+            "RETURNING *",
+            (*params, limit),
+        ).fetchall()
+        if rows and table == 'actions':
+            # A snapshot without its action would let replay skip the pruned events.
+            conn.executemany(
+                "DELETE FROM snapshots WHERE session_id = ? AND action_id = ?",
+                [(row['session_id'], row['id']) for row in rows],
+            )
+        if rows and archive is not None:
+            archive(table, [dict(row) for row in rows])
+    return len(rows)
+
+
+def incremental_vacuum_enabled() -> bool:
+    return get_connection().execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def enable_incremental_vacuum() -> bool:
+    if incremental_vacuum_enabled():
+        return False
+    # Switching an existing file to incremental mode needs one full VACUUM,
+    # which holds the write lock for the whole rewrite.
+    conn = get_connection()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def incremental_vacuum(pages: int) -> int:
+    conn = get_connection()
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if free:
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return min(free, pages)
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Optional
+
+from . import circuit, db, noise, quantum, rng
+from .circuit import CircuitState
+from .config import settings
+from .models import CircuitOperation
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ('trials', 'circuit')
+PROGRESS_STEPS = 100
+
+Progress = Callable[[float], None]
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+def _load_state(session_id: str) -> CircuitState:
+    vector, state_model = db.fetch_session(session_id)
+    return CircuitState(
+        vector, dict(state_model.collapsed), dict(state_model.last_measurement), state_model.version
+    )
+
+
+def _run_trials_job(
+    session_id: str, params: Dict[str, Any], progress: Progress, work: db.UnitOfWork
+) -> Dict[str, Any]:
+    state = _load_state(session_id)
+    n = params['n']
+    every = max(n // PROGRESS_STEPS, 1)
+    counts: Dict[str, int] = {}
+    freqs: Dict[str, float] = {}
+    generator = rng.get_rng(session_id)
+    readout_error = noise.resolve(params.get('noise')).readout_error
+    for done, counts, freqs in quantum.stream_trials(state.vector, params['qubit'], n, every, generator, readout_error):
+        progress(done / n)
+    work.log_trials(session_id, params['qubit'], n, counts, freqs)
+    return {'counts': counts, 'freqs': freqs}
+
+
+def _run_circuit_job(
+    session_id: str, params: Dict[str, Any], progress: Progress, work: db.UnitOfWork
+) -> Dict[str, Any]:
+    state = _load_state(session_id)
+    operations = [CircuitOperation.parse_obj(operation) for operation in params['operations']]
+    generator = rng.get_rng(session_id)
+    model = noise.resolve(params.get('noise'))
+    initial = state.vector.copy()
+    step = max(len(operations) // PROGRESS_STEPS, 1)
+    outcomes = []
+    for start in range(0, len(operations), step):
+        outcomes.extend(circuit.run_circuit(state, operations[start:start + step], generator))
+        progress(min(start + step, len(operations)) / len(operations))
+    result: Dict[str, Any] = {'outcomes': outcomes}
+    if params.get('trials') is not None:
+        if model.gate_noise:
+            counts, freqs = noise.run_trials(
+                initial, operations, params['trials_scope'], params['trials'], model, generator
+            )
+        else:
+            counts, freqs = quantum.run_trials(
+                state.vector, params['trials_scope'], params['trials'], generator, model.readout_error
+            )
+        result['trials'] = {'counts': counts, 'freqs': freqs}
+
+    state_model = work.update_session(
+        session_id, state.vector, state.collapsed, state.last_measurement, state.version
+    )
+    work.log_action(
+        session_id,
+        'CIRCUIT',
+        {'operations': params['operations'], 'outcomes': outcomes, 'state': state.vector},
+    )
+    if 'trials' in result:
+        trials = result['trials']
+        work.log_trials(session_id, params['trials_scope'], params['trials'], trials['counts'], trials['freqs'])
+    result['state'] = state_model.dict()
+    return result
+
+
+_HANDLERS = {
+    'trials': _run_trials_job,
+    'circuit': _run_circuit_job,
+}
+
+
+class JobRunner:
+    """Thread pool executing queued simulation jobs recorded in the jobs table.
+
+    Workers report progress back to the table and check for cancellation
+    between chunks, so a cancelled job stops within one chunk of work. A
+    job's result and session changes commit together with its ``succeeded``
+    status, and only while it is still running, so a late cancel wins.
+    """
+
+    def __init__(self, workers: int, max_active: int):
+        self.workers = workers
+        self.max_active = max_active
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = Lock()
+        self._cancel: Dict[str, Event] = {}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job-worker')
+        db.interrupt_jobs()
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            for event in self._cancel.values():
+                event.set()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, session_id: str, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.start()
+        with self._lock:
+            if len(self._cancel) >= self.max_active:
+                raise JobQueueFull('Too many active jobs')
+            job = db.create_job(session_id, kind, params)
+            self._cancel[job['id']] = Event()
+            self._executor.submit(self._run, job['id'], session_id, kind, params)
+        return job
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        # The job may belong to another worker process; its runner sees the
+        # cancelled status the next time it reports progress.
+        with self._lock:
+            event = self._cancel.get(job_id)
+            if event is not None:
+                event.set()
+            db.update_job(job_id, status='cancelled', only_if=db.JOB_ACTIVE_STATUSES)
+        return db.fetch_job(job_id)
+
+    def _run(self, job_id: str, session_id: str, kind: str, params: Dict[str, Any]) -> None:
+        with self._lock:
+            cancelled = self._cancel[job_id]
+            if cancelled.is_set() or not db.update_job(job_id, status='running', only_if=('queued',)):
+                self._cancel.pop(job_id, None)
+                return
+
+        def progress(fraction: float) -> None:
+            if cancelled.is_set() or db.fetch_job(job_id)['status'] == 'cancelled':
+                raise JobCancelled()
+            db.update_job(job_id, progress=fraction)
+
+        running = ('running',)
+        try:
+            with db.transaction() as work:
+                work.finish_job(job_id, _HANDLERS[kind](session_id, params, progress, work))
+        except (JobCancelled, db.JobNotRunning):
+            db.update_job(job_id, status='cancelled', only_if=running)
+        except KeyError as exc:
+            db.update_job(job_id, status='failed', error=str(exc.args[0]), only_if=running)
+        except (ValueError, db.SessionConflict) as exc:
+            db.update_job(job_id, status='failed', error=str(exc), only_if=running)
+        except Exception as exc:
+            logger.exception('Job %s failed', job_id)
+            db.update_job(job_id, status='failed', error=str(exc) or type(exc).__name__, only_if=running)
+        finally:
+            with self._lock:
+                self._cancel.pop(job_id, None)
+            db.purge_jobs(settings.jobs_retention_seconds, settings.jobs_max_finished)
+
+
+_runner = JobRunner(settings.jobs_workers, settings.jobs_max_active)
+
+
+def start() -> None:
+    _runner.start()
+
+
+def stop() -> None:
+    _runner.stop()
+
+
+def submit(session_id: str, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    return _runner.submit(session_id, kind, params)
+
+
+def cancel(job_id: str) -> Dict[str, Any]:
+    return _runner.cancel(job_id)
@@ -1,23 +1,53 @@
 from __future__ import annotations
 
-from typing import Dict
+import json
+from collections import defaultdict
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
 
-from . import db, quantum
+import numpy as np
+
+from . import circuit, compute, db, jobs, noise, observables, quantum, retention, rng, sweep
+from .circuit import CircuitState, Outcome
+from .config import settings
 from .models import (
+    BulkGateRequest,
+    BulkStateRequest,
+    BulkStateResponse,
+    CircuitOperation,
+    CircuitRequest,
+    CircuitResponse,
     GateRequest,
     HardResetRequest,
+    HistoryResponse,
+    JobRequest,
+    JobResponse,
+    JobResultResponse,
     MeasureRequest,
     MeasureResponse,
+    NoiseParameters,
+    ObservablesRequest,
+    ObservablesResponse,
+    QuantumStateModel,
+    ReplayResponse,
     ResetRequest,
+    SessionRequest,
     SessionResponse,
     StateResponse,
+    SweepRequest,
+    SweepResponse,
+    TrialsHistoryResponse,
     TrialsRequest,
     TrialsResponse,
+    TrialsStreamRequest,
 )
-from .utils import vector_to_dict
+from .utils import qubit_labels, vector_diff, vector_to_dict
 
 app = FastAPI(title="Quantum Circuit Playground API", version="1.0.0")
 
@@ -29,9 +59,29 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(db.SessionConflict)
+async def session_conflict_handler(request: Request, exc: db.SessionConflict) -> JSONResponse:
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+
 @app.on_event("startup")
 def startup() -> None:
     db.init_db()
+    db.start_cache()
+    db.start_audit_log()
+    compute.start()
+    jobs.start()
+    retention.start()
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    retention.stop()
+    jobs.stop()
+    compute.stop()
+    db.stop_audit_log()
+    db.stop_cache()
+    db.close_connections()
 
 
 @app.get("/api/health")
@@ -39,9 +89,29 @@ def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/api/metrics")
+def metrics() -> Dict[str, Dict[str, float]]:
+    return {"audit_log": db.audit_log_metrics(), "compute": compute.metrics(), "retention": retention.metrics()}
+
+
 @app.post("/api/session/new", response_model=SessionResponse)
-def create_session_route() -> SessionResponse:
-    return db.create_session()
+def create_session_route(payload: Optional[SessionRequest] = None) -> SessionResponse:
+    generator = None
+    if payload is not None and (payload.rng is not None or payload.seed is not None):
+        # The generator lives in this worker's memory only, so other workers would not see it.
+        if settings.web_concurrency > 1:
+            raise HTTPException(
+                status_code=400,
+                detail="Per-session rng/seed overrides need a single worker; use the QUANTUM_RNG_* settings",
+            )
+        try:
+            generator = rng.create_rng(payload.rng or settings.rng_backend, payload.seed)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from None
+    session = db.create_session(payload.num_qubits if payload is not None else 2)
+    if generator is not None:
+        rng.configure_session(session.session_id, generator)
+    return session
 
 
 @app.get("/api/state/{session_id}", response_model=StateResponse)
@@ -53,95 +123,441 @@ def get_state(session_id: str) -> StateResponse:
     return StateResponse(state=state_model)
 
 
-@app.post("/api/gate/apply", response_model=StateResponse)
-def apply_gate_route(payload: GateRequest) -> StateResponse:
-    try:
-        vector, _ = db.fetch_session(payload.session_id)
-    except KeyError:
-        raise HTTPException(status_code=404, detail="Session not found") from None
+HISTORY_PAGE_LIMIT = 1000
 
-    new_vector = quantum.apply_gate_to_state(vector, payload.gate)
-    collapsed = {"Q1": False, "Q2": False}
-    last_measurement = {"Q1": None, "Q2": None}
-    state_model = db.update_session_state(payload.session_id, new_vector, collapsed, last_measurement)
-    db.log_action(
-        payload.session_id,
-        "GATE",
-        {"gate": payload.gate, "state": vector_to_dict(new_vector)},
-    )
-    return StateResponse(state=state_model)
 
+def _history_session(session_id: str) -> None:
+    if not db.session_exists(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    # Let queued audit rows land so a page reflects everything already acknowledged.
+    db.flush_audit_log(timeout=1.0)
 
-@app.post("/api/measure", response_model=MeasureResponse)
-def measure_route(payload: MeasureRequest) -> MeasureResponse:
+
+@app.get("/api/session/{session_id}/history", response_model=HistoryResponse)
+def history_route(
+    session_id: str,
+    type: Optional[List[str]] = Query(None),
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=HISTORY_PAGE_LIMIT),
+) -> HistoryResponse:
+    _history_session(session_id)
+    items, next_cursor = db.fetch_history(session_id, type or (), cursor, limit)
+    return HistoryResponse(items=items, next_cursor=next_cursor)
+
+
+@app.get("/api/session/{session_id}/trials", response_model=TrialsHistoryResponse)
+def trials_history_route(
+    session_id: str,
+    scope: Optional[List[str]] = Query(None),
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=HISTORY_PAGE_LIMIT),
+) -> TrialsHistoryResponse:
+    _history_session(session_id)
+    items, next_cursor = db.fetch_trials(session_id, scope or (), cursor, limit)
+    return TrialsHistoryResponse(items=items, next_cursor=next_cursor)
+
+
+@app.get("/api/session/{session_id}/replay", response_model=ReplayResponse)
+def replay_route(session_id: str, action_id: Optional[int] = None) -> ReplayResponse:
+    _history_session(session_id)
     try:
-        vector, current_state = db.fetch_session(payload.session_id)
+        target, snapshot, snapshot_action, events = db.fetch_replay(session_id, action_id)
     except KeyError:
-        raise HTTPException(status_code=404, detail="Session not found") from None
-
-    if payload.qubit == "BOTH":
-        outcome, collapsed_vector = quantum.measure_both(vector)
-        collapsed_flags = {"Q1": True, "Q2": True}
-        last_measurement = {"Q1": outcome["Q1"], "Q2": outcome["Q2"]}
+        raise HTTPException(status_code=404, detail="Action not found") from None
+    if snapshot is not None:
+        state = CircuitState(snapshot.vector, snapshot.collapsed, snapshot.last_measurement)
+    elif events and events[0][0] == "SESSION_CREATE":
+        payload = events[0][1]
+        count = payload.get("num_qubits") or payload.get("state", {}).get("num_qubits", 2)
+        state = circuit.initial_circuit_state(count)
     else:
-        result, collapsed_vector = quantum.measure_qubit(vector, payload.qubit)
-        outcome = {"Q1": current_state.last_measurement.get("Q1"), "Q2": current_state.last_measurement.get("Q2")}
-        outcome[payload.qubit] = result
-        collapsed_flags = {"Q1": False, "Q2": False}
-        collapsed_flags[payload.qubit] = True
-        last_measurement = {"Q1": None, "Q2": None}
-        last_measurement[payload.qubit] = result
-    state_model = db.update_session_state(payload.session_id, collapsed_vector, collapsed_flags, last_measurement)
-    db.log_action(
-        payload.session_id,
-        "MEASURE",
-        {"scope": payload.qubit, "outcome": outcome},
+        raise HTTPException(status_code=409, detail="History before this action has been pruned")
+    try:
+        circuit.replay(state, events)
+    except (KeyError, ValueError, ValidationError) as exc:
+        raise HTTPException(status_code=409, detail=f"Action log cannot be replayed: {exc}") from None
+    return ReplayResponse(
+        action_id=target,
+        snapshot_action_id=snapshot_action,
+        events_replayed=len(events),
+        state=QuantumStateModel(
+            num_qubits=quantum.num_qubits(state.vector),
+            vector=vector_to_dict(state.vector),
+            collapsed=state.collapsed,
+            last_measurement=state.last_measurement,
+        ),
     )
-    return MeasureResponse(outcome=outcome, state=state_model)
 
 
-@app.post("/api/reset", response_model=StateResponse)
-def reset_route(payload: ResetRequest) -> StateResponse:
+def _load_session(session_id: str) -> CircuitState:
     try:
-        vector, _ = db.fetch_session(payload.session_id)
+        vector, state_model = db.fetch_session(session_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="Session not found") from None
-
-    new_vector = quantum.reset_qubit(vector, payload.qubit)
-    collapsed_flags = {"Q1": False, "Q2": False}
-    last_measurement = {"Q1": None, "Q2": None}
-    last_measurement[payload.qubit] = 0
-    state_model = db.update_session_state(payload.session_id, new_vector, collapsed_flags, last_measurement)
-    db.log_action(
-        payload.session_id,
-        "RESET",
-        {"qubit": payload.qubit},
+    return CircuitState(
+        vector, dict(state_model.collapsed), dict(state_model.last_measurement), state_model.version
     )
-    return StateResponse(state=state_model)
+
+
+def _apply(session_id: str, state: CircuitState, operation: CircuitOperation) -> Optional[Outcome]:
+    try:
+        return circuit.apply_operation(state, operation, rng.get_rng(session_id))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from None
+
+
+def _commit(
+    session_id: str, state: CircuitState, operation: CircuitOperation, outcome: Optional[Outcome]
+) -> QuantumStateModel:
+    with db.transaction() as work:
+        state_model = work.update_session(
+            session_id, state.vector, state.collapsed, state.last_measurement, state.version
+        )
+        work.log_action(session_id, *circuit.action_log_entry(state, operation, outcome))
+    return state_model
+
+
+@app.post("/api/gate/apply", response_model=StateResponse)
+def apply_gate_route(payload: GateRequest) -> StateResponse:
+    state = _load_session(payload.session_id)
+    operation = CircuitOperation(type="gate", gate=payload.gate, qubits=payload.qubits, theta=payload.theta)
+    _apply(payload.session_id, state, operation)
+    return StateResponse(state=_commit(payload.session_id, state, operation, None))
+
+
+@app.post("/api/measure", response_model=MeasureResponse)
+def measure_route(payload: MeasureRequest) -> MeasureResponse:
+    state = _load_session(payload.session_id)
+    operation = CircuitOperation(type="measure", qubit=payload.qubit)
+    outcome = _apply(payload.session_id, state, operation)
+    return MeasureResponse(outcome=outcome, state=_commit(payload.session_id, state, operation, outcome))
+
+
+@app.post("/api/reset", response_model=StateResponse)
+def reset_route(payload: ResetRequest) -> StateResponse:
+    state = _load_session(payload.session_id)
+    operation = CircuitOperation(type="reset", qubit=payload.qubit)
+    _apply(payload.session_id, state, operation)
+    return StateResponse(state=_commit(payload.session_id, state, operation, None))
 
 
 @app.post("/api/reset/hard", response_model=StateResponse)
 def hard_reset_route(payload: HardResetRequest) -> StateResponse:
+    state = _load_session(payload.session_id)
+    operation = CircuitOperation(type="hard_reset")
+    _apply(payload.session_id, state, operation)
+    return StateResponse(state=_commit(payload.session_id, state, operation, None))
+
+
+@app.post("/api/sessions/state", response_model=BulkStateResponse)
+def bulk_state_route(payload: BulkStateRequest) -> BulkStateResponse:
+    found = db.fetch_sessions(payload.session_ids)
+    return BulkStateResponse(
+        states={session_id: state_model for session_id, (_, state_model) in found.items()},
+        missing=[session_id for session_id in dict.fromkeys(payload.session_ids) if session_id not in found],
+    )
+
+
+@app.post("/api/sessions/gate/apply", response_model=BulkStateResponse)
+def bulk_gate_route(payload: BulkGateRequest) -> BulkStateResponse:
+    found = db.fetch_sessions([item.session_id for item in payload.items])
+    missing = [item.session_id for item in payload.items if item.session_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Sessions not found: {missing}")
+
+    # Sessions sharing a register width and gate are stacked and evolved in one call.
+    groups: Dict[Tuple, List] = defaultdict(list)
     try:
-        db.fetch_session(payload.session_id)
-    except KeyError:
-        raise HTTPException(status_code=404, detail="Session not found") from None
+        for item in payload.items:
+            count = quantum.num_qubits(found[item.session_id][0])
+            targets = quantum.gate_qubits(item.gate, item.qubits, count)
+            groups[count, item.gate, targets, item.theta].append(item)
+        evolved = {}
+        for (count, gate, targets, theta), items in groups.items():
+            stacked = np.stack([found[item.session_id][0] for item in items])
+            for item, vector in zip(items, quantum.apply_gate_batch(stacked, gate, targets, theta)):
+                evolved[item.session_id] = vector
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from None
+
+    states = {}
+    with db.transaction() as work:
+        for item in payload.items:
+            vector = evolved[item.session_id]
+            labels = qubit_labels(quantum.num_qubits(vector))
+            states[item.session_id] = work.update_session(
+                item.session_id,
+                vector,
+                {label: False for label in labels},
+                {label: None for label in labels},
+                found[item.session_id][1].version,
+            )
+            entry = {"gate": item.gate, "qubits": item.qubits, "state": vector}
+            if item.theta is not None:
+                entry["theta"] = item.theta
+            work.log_action(item.session_id, "GATE", entry)
+    return BulkStateResponse(states=states)
 
-    new_vector = quantum.hard_reset()
-    collapsed_flags = {"Q1": False, "Q2": False}
-    last_measurement = {"Q1": 0, "Q2": 0}
-    state_model = db.update_session_state(payload.session_id, new_vector, collapsed_flags, last_measurement)
-    db.log_action(payload.session_id, "HARD_RESET", {})
-    return StateResponse(state=state_model)
+
+def _noise_model(override: Optional[NoiseParameters]) -> noise.NoiseModel:
+    return noise.resolve(override.dict() if override is not None else None)
 
 
 @app.post("/api/trials", response_model=TrialsResponse)
 def trials_route(payload: TrialsRequest) -> TrialsResponse:
+    state = _load_session(payload.session_id)
+    generator = rng.get_rng(payload.session_id)
+    # Sampling a stored state runs no gates, so only readout error applies.
+    readout_error = _noise_model(payload.noise).readout_error
     try:
-        vector, _ = db.fetch_session(payload.session_id)
+        if payload.mode == "exact":
+            result = quantum.exact_trials(
+                state.vector, payload.qubit, payload.n, payload.confidence, payload.sample, generator, readout_error
+            )
+            response = TrialsResponse(**result)
+        else:
+            counts, freqs = compute.run_trials(state.vector, payload.qubit, payload.n, generator, readout_error)
+            response = TrialsResponse(counts=counts, freqs=freqs)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from None
+    except compute.ComputeOverloaded as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from None
+    except compute.ComputeTimeout as exc:
+        raise HTTPException(status_code=504, detail=str(exc)) from None
+    if payload.mode == "sample" or payload.sample:
+        db.log_trials(payload.session_id, payload.qubit, payload.n, response.counts, response.freqs)
+    return response
+
+
+def _job_response(job: Dict[str, Any]) -> JobResponse:
+    return JobResponse(job_id=job["id"], **{key: job[key] for key in JobResponse.__fields__ if key in job})
+
+
+def _fetch_job(job_id: str) -> Dict[str, Any]:
+    try:
+        return db.fetch_job(job_id)
     except KeyError:
-        raise HTTPException(status_code=404, detail="Session not found") from None
+        raise HTTPException(status_code=404, detail="Job not found") from None
+
+
+@app.post("/api/jobs", response_model=JobResponse, status_code=202)
+def submit_job_route(payload: JobRequest) -> JobResponse:
+    _load_session(payload.session_id)
+    if payload.kind == "trials":
+        params: Dict[str, Any] = {"qubit": payload.qubit, "n": payload.n}
+    else:
+        params = {
+            "operations": [operation.dict(exclude_none=True) for operation in payload.operations],
+            "trials": payload.trials,
+            "trials_scope": payload.trials_scope,
+        }
+    # Resolved now so a job keeps the noise model it was submitted with.
+    params["noise"] = asdict(_noise_model(payload.noise))
+    try:
+        job = jobs.submit(payload.session_id, payload.kind, params)
+    except jobs.JobQueueFull as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from None
+    return _job_response(job)
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+def job_status_route(job_id: str) -> JobResponse:
+    return _job_response(_fetch_job(job_id))
+
+
+@app.get("/api/jobs/{job_id}/result", response_model=JobResultResponse)
+def job_result_route(job_id: str) -> JobResultResponse:
+    job = _fetch_job(job_id)
+    if job["status"] in db.JOB_ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return JobResultResponse(job_id=job_id, status=job["status"], result=job["result"], error=job["error"])
+
+
+@app.post("/api/jobs/{job_id}/cancel", response_model=JobResponse)
+def cancel_job_route(job_id: str) -> JobResponse:
+    _fetch_job(job_id)
+    return _job_response(jobs.cancel(job_id))
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def _stream_event(fmt: str, event: Dict[str, Any]) -> str:
+    data = json.dumps(event)
+    if fmt == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@app.post("/api/trials/stream")
+async def trials_stream_route(payload: TrialsStreamRequest) -> StreamingResponse:
+    state = await run_in_threadpool(_load_session, payload.session_id)
+    every = payload.every or settings.trials_stream_every
+    progress = quantum.stream_trials(
+        state.vector,
+        payload.qubit,
+        payload.n,
+        every,
+        rng.get_rng(payload.session_id),
+        _noise_model(payload.noise).readout_error,
+    )
+    try:
+        # Draw the first chunk up front so invalid requests still get a 400.
+        first = await run_in_threadpool(next, progress)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from None
+
+    async def events() -> AsyncIterator[str]:
+        # Each chunk runs in the threadpool; when the client disconnects the
+        # response task is cancelled at the next await, so no further shots are
+        # drawn and nothing is persisted.
+        done, counts, freqs = first
+        while done < payload.n:
+            event = {"type": "progress", "done": done, "n": payload.n, "counts": counts, "freqs": freqs}
+            yield _stream_event(payload.format, event)
+            done, counts, freqs = await run_in_threadpool(next, progress)
+        await run_in_threadpool(db.log_trials, payload.session_id, payload.qubit, payload.n, counts, freqs)
+        event = {"type": "result", "done": done, "n": payload.n, "counts": counts, "freqs": freqs}
+        yield _stream_event(payload.format, event)
+
+    return StreamingResponse(events(), media_type=STREAM_MEDIA_TYPES[payload.format])
+
+
+@app.post("/api/observables", response_model=ObservablesResponse)
+def observables_route(payload: ObservablesRequest) -> ObservablesResponse:
+    state = _load_session(payload.session_id)
+    try:
+        expectations = observables.expectation_values(state.vector, payload.observables)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from None
+    return ObservablesResponse(expectations=expectations, version=state.version or 0)
+
+
+@app.post("/api/sweep", response_model=SweepResponse)
+def sweep_route(payload: SweepRequest) -> SweepResponse:
+    if payload.session_id is not None:
+        vector = _load_session(payload.session_id).vector
+    else:
+        vector = quantum.initial_state(payload.num_qubits)
+    try:
+        names, grid, labels, probabilities = sweep.run_sweep(
+            vector, payload.operations, payload.parameters, payload.scope
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from None
+    return SweepResponse(
+        parameters=names, points=grid.tolist(), outcomes=labels, probabilities=probabilities.tolist()
+    )
+
+
+@app.post("/api/circuit/run", response_model=CircuitResponse)
+def circuit_route(payload: CircuitRequest) -> CircuitResponse:
+    state = _load_session(payload.session_id)
+    generator = rng.get_rng(payload.session_id)
+    try:
+        outcomes, result = compute.run_circuit(
+            state, payload.operations, generator, payload.trials, payload.trials_scope, _noise_model(payload.noise)
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from None
+    except compute.ComputeOverloaded as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from None
+    except compute.ComputeTimeout as exc:
+        raise HTTPException(status_code=504, detail=str(exc)) from None
+    trials = TrialsResponse(counts=result[0], freqs=result[1]) if result is not None else None
+
+    with db.transaction() as work:
+        state_model = work.update_session(
+            payload.session_id, state.vector, state.collapsed, state.last_measurement, state.version
+        )
+        work.log_action(
+            payload.session_id,
+            "CIRCUIT",
+            {
+                "operations": [operation.dict(exclude_none=True) for operation in payload.operations],
+                "outcomes": outcomes,
+                "state": state.vector,
+            },
+        )
+        if trials is not None:
+            work.log_trials(payload.session_id, payload.trials_scope, payload.trials, trials.counts, trials.freqs)
+    return CircuitResponse(state=state_model, outcomes=outcomes, trials=trials)
+
+
+def _socket_snapshot(state: CircuitState) -> Dict[str, Any]:
+    return {
+        "num_qubits": quantum.num_qubits(state.vector),
+        "vector": vector_to_dict(state.vector),
+        "collapsed": state.collapsed,
+        "last_measurement": state.last_measurement,
+    }
+
+
+def _socket_step(session_id: str, operation: CircuitOperation) -> Tuple[CircuitState, Optional[Outcome]]:
+    state = _load_session(session_id)
+    outcome = _apply(session_id, state, operation)
+    with db.transaction() as work:
+        work.stage_session(session_id, state.vector, state.collapsed, state.last_measurement, state.version)
+        work.log_action(session_id, *circuit.action_log_entry(state, operation, outcome))
+    return state, outcome
+
+
+@app.websocket("/ws/session/{session_id}")
+async def session_socket(websocket: WebSocket, session_id: str) -> None:
+    await websocket.accept()
+    try:
+        seen = await run_in_threadpool(_load_session, session_id)
+    except HTTPException as exc:
+        await websocket.send_json({"type": "error", "detail": exc.detail})
+        await websocket.close(code=4404)
+        return
+    await websocket.send_json({"type": "state", "seq": 0, "state": _socket_snapshot(seen)})
+
+    seq = 0
+    while True:
+        try:
+            message = await websocket.receive_json()
+        except WebSocketDisconnect:
+            return
+        except ValueError:
+            await websocket.send_json({"type": "error", "detail": "Messages must be JSON objects"})
+            continue
+        request_id = message.get("id") if isinstance(message, dict) else None
+        try:
+            if message.get("type") == "sync":
+                seen = await run_in_threadpool(_load_session, session_id)
+                await websocket.send_json({"type": "state", "id": request_id, "seq": seq, "state": _socket_snapshot(seen)})
+                continue
+            operation = CircuitOperation.parse_obj(message)
+            state, outcome = await run_in_threadpool(_socket_step, session_id, operation)
+        except (AttributeError, ValidationError) as exc:
+            await websocket.send_json({"type": "error", "id": request_id, "detail": str(exc)})
+            continue
+        except HTTPException as exc:
+            await websocket.send_json({"type": "error", "id": request_id, "detail": exc.detail})
+            continue
+        except db.SessionConflict as exc:
+            await websocket.send_json({"type": "error", "id": request_id, "detail": str(exc)})
+            continue
 
-    counts, freqs = quantum.run_trials(vector, payload.qubit, payload.n)
-    db.log_trials(payload.session_id, payload.qubit, payload.n, counts, freqs)
-    return TrialsResponse(counts=counts, freqs=freqs)
+        seq += 1
+        changed = vector_diff(seen.vector, state.vector)
+        if changed is None:
+            # Too many amplitudes changed for a diff, so the client gets a full state instead.
+            message = {"type": "state", "id": request_id, "seq": seq, "state": _socket_snapshot(state)}
+            if outcome is not None:
+                message["outcome"] = outcome
+            seen = state
+            await websocket.send_json(message)
+            continue
+        diff: Dict[str, Any] = {"type": "diff", "id": request_id, "seq": seq, "vector": changed}
+        for field in ("collapsed", "last_measurement"):
+            changes = {
+                label: value for label, value in getattr(state, field).items() if getattr(seen, field).get(label) != value
+            }
+            if changes:
+                diff[field] = changes
+        if outcome is not None:
+            diff["outcome"] = outcome
+        seen = state
+        await websocket.send_json(diff)
@@ -1,11 +1,36 @@
 from __future__ import annotations
 
-from typing import Dict, Literal, Optional
+import math
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, StrictInt, constr, validator
 
+from .config import settings
+from .quantum import MAX_QUBITS, PARAMETRIC_GATES
 from .utils import BASIS_STATES
 
+QUBIT_PATTERN = r'^Q[1-9][0-9]*$'
+SCOPE_PATTERN = r'^(Q[1-9][0-9]*|BOTH|ALL)$'
+
+# Gate targets are 1-based labels ("Q3"), like measure/reset/trials, or 0-based indices (2).
+QubitRef = Union[StrictInt, constr(regex=QUBIT_PATTERN)]
+
+SWEEP_MAX_PARAMETERS = 16
+SWEEP_MAX_VALUES = 10000
+
+GateName = Literal['X', 'H', 'CNOT', 'RX', 'RY', 'RZ', 'P', 'CP']
+
+
+def _check_theta(value: Optional[float], values) -> Optional[float]:
+    gate = values.get('gate')
+    if value is not None and not math.isfinite(value):
+        raise ValueError('theta must be a finite number')
+    if gate in PARAMETRIC_GATES and value is None:
+        raise ValueError(f'gate {gate} requires an angle theta')
+    if gate is not None and gate not in PARAMETRIC_GATES and value is not None:
+        raise ValueError(f'gate {gate} does not take an angle')
+    return value
+
 
 class ComplexAmplitude(BaseModel):
     real: float
@@ -13,15 +38,34 @@ class ComplexAmplitude(BaseModel):
 
 
 class QuantumStateModel(BaseModel):
+    num_qubits: int = 2
     vector: Dict[str, ComplexAmplitude]
     collapsed: Dict[str, bool]
     last_measurement: Dict[str, Optional[int]]
+    version: int = 0
 
     @validator('vector')
-    def validate_basis(cls, value: Dict[str, ComplexAmplitude]):
-        missing = [basis for basis in BASIS_STATES if basis not in value]
-        if missing:
-            raise ValueError(f'Missing amplitudes for basis states: {missing}')
+    def validate_basis(cls, value: Dict[str, ComplexAmplitude], values):
+        num_qubits = values.get('num_qubits', 2)
+        if num_qubits == 2:
+            missing = [basis for basis in BASIS_STATES if basis not in value]
+            if missing:
+                raise ValueError(f'Missing amplitudes for basis states: {missing}')
+        invalid = [basis for basis in value if len(basis) != num_qubits or set(basis) - {'0', '1'}]
+        if invalid:
+            raise ValueError(f'Invalid basis states for {num_qubits} qubits: {invalid}')
+        return value
+
+
+class SessionRequest(BaseModel):
+    num_qubits: int = Field(2, ge=1, le=MAX_QUBITS)
+    rng: Optional[Literal['secure', 'philox']] = None
+    seed: Optional[int] = Field(None, ge=0)
+
+    @validator('seed')
+    def validate_seed(cls, value: Optional[int], values):
+        if value is not None and (values.get('rng') or settings.rng_backend) == 'secure':
+            raise ValueError('The secure RNG backend cannot be seeded')
         return value
 
 
@@ -39,34 +83,266 @@ class StateResponse(BaseModel):
 
 class GateRequest(BaseModel):
     session_id: str
-    gate: Literal['X', 'H', 'CNOT']
+    gate: GateName
+    qubits: Optional[List[QubitRef]] = None
+    theta: Optional[float] = None
+
+    _check_theta = validator('theta', always=True, allow_reuse=True)(_check_theta)
 
 
 class MeasureRequest(BaseModel):
     session_id: str
-    qubit: Literal['Q1', 'Q2', 'BOTH']
+    qubit: str = Field(..., regex=SCOPE_PATTERN)
 
 
 class MeasureResponse(BaseModel):
-    outcome: Dict[str, int]
+    outcome: Dict[str, Optional[int]]
     state: QuantumStateModel
 
 
 class ResetRequest(BaseModel):
     session_id: str
-    qubit: Literal['Q1', 'Q2']
+    qubit: str = Field(..., regex=QUBIT_PATTERN)
 
 
 class HardResetRequest(BaseModel):
     session_id: str
 
 
+class NoiseParameters(BaseModel):
+    depolarizing: float = Field(0.0, ge=0, le=1)
+    amplitude_damping: float = Field(0.0, ge=0, le=1)
+    readout_error: float = Field(0.0, ge=0, le=1)
+
+
 class TrialsRequest(BaseModel):
     session_id: str
-    qubit: Literal['Q1', 'Q2', 'BOTH']
+    qubit: str = Field(..., regex=SCOPE_PATTERN)
     n: int
+    mode: Literal['sample', 'exact'] = 'sample'
+    sample: bool = False
+    confidence: float = Field(0.95, gt=0, lt=1)
+    noise: Optional[NoiseParameters] = None
 
 
 class TrialsResponse(BaseModel):
     counts: Dict[str, int]
     freqs: Dict[str, float]
+    probabilities: Optional[Dict[str, float]] = None
+    intervals: Optional[Dict[str, Tuple[float, float]]] = None
+
+
+class TrialsStreamRequest(BaseModel):
+    session_id: str
+    qubit: str = Field(..., regex=SCOPE_PATTERN)
+    n: int
+    every: Optional[int] = Field(None, ge=1)
+    format: Literal['ndjson', 'sse'] = 'ndjson'
+    noise: Optional[NoiseParameters] = None
+
+
+class CircuitOperation(BaseModel):
+    type: Literal['gate', 'measure', 'reset', 'hard_reset']
+    gate: Optional[GateName] = None
+    qubits: Optional[List[QubitRef]] = None
+    theta: Optional[float] = None
+    qubit: Optional[str] = Field(None, regex=SCOPE_PATTERN)
+
+    _check_theta = validator('theta', always=True, allow_reuse=True)(_check_theta)
+
+    @validator('qubit', always=True)
+    def validate_target(cls, value: Optional[str], values):
+        kind = values.get('type')
+        if kind == 'gate' and values.get('gate') is None:
+            raise ValueError('gate operations require a gate')
+        if kind in ('measure', 'reset') and value is None:
+            raise ValueError(f'{kind} operations require a qubit')
+        if kind == 'reset' and value in ('BOTH', 'ALL'):
+            raise ValueError('reset operations target a single qubit')
+        return value
+
+
+class CircuitRequest(BaseModel):
+    session_id: str
+    operations: List[CircuitOperation] = Field(..., max_items=10000)
+    trials: Optional[int] = Field(None, gt=0)
+    trials_scope: str = Field('ALL', regex=SCOPE_PATTERN)
+    noise: Optional[NoiseParameters] = None
+
+
+class ObservablesRequest(BaseModel):
+    session_id: str
+    observables: List[str] = Field(..., min_items=1, max_items=1000)
+
+
+class ObservablesResponse(BaseModel):
+    expectations: Dict[str, float]
+    version: int
+
+
+class SweepOperation(BaseModel):
+    gate: GateName
+    qubits: Optional[List[QubitRef]] = None
+    theta: Optional[float] = None
+    param: Optional[str] = None
+
+    @validator('param', always=True)
+    def validate_angle(cls, value: Optional[str], values):
+        gate = values.get('gate')
+        theta = values.get('theta')
+        if theta is not None and not math.isfinite(theta):
+            raise ValueError('theta must be a finite number')
+        bound = values.get('theta') is not None or value is not None
+        if gate in PARAMETRIC_GATES and not bound:
+            raise ValueError(f'gate {gate} requires an angle theta or a sweep parameter')
+        if gate in PARAMETRIC_GATES and values.get('theta') is not None and value is not None:
+            raise ValueError('give either theta or param, not both')
+        if gate is not None and gate not in PARAMETRIC_GATES and bound:
+            raise ValueError(f'gate {gate} does not take an angle')
+        return value
+
+
+class SweepRequest(BaseModel):
+    session_id: Optional[str] = None
+    num_qubits: int = Field(2, ge=1, le=MAX_QUBITS)
+    operations: List[SweepOperation] = Field(..., max_items=1000)
+    parameters: Dict[str, List[float]] = Field(..., min_items=1)
+    scope: str = Field('ALL', regex=SCOPE_PATTERN)
+
+    @validator('parameters')
+    def validate_parameters(cls, value: Dict[str, List[float]]):
+        empty = [name for name, values in value.items() if not values]
+        if empty:
+            raise ValueError(f'parameters without values: {empty}')
+        if len(value) > SWEEP_MAX_PARAMETERS:
+            raise ValueError(f'at most {SWEEP_MAX_PARAMETERS} sweep parameters are allowed')
+        long = [name for name, values in value.items() if len(values) > SWEEP_MAX_VALUES]
+        if long:
+            raise ValueError(f'parameters with more than {SWEEP_MAX_VALUES} values: {long}')
+        infinite = [name for name, values in value.items() if not all(map(math.isfinite, values))]
+        if infinite:
+            raise ValueError(f'parameters with non-finite values: {infinite}')
+        return value
+
+    @validator('scope', always=True)
+    def validate_bindings(cls, value: str, values):
+        names = values.get('parameters') or {}
+        unknown = {op.param for op in values.get('operations') or [] if op.param is not None} - set(names)
+        if unknown:
+            raise ValueError(f'operations reference unknown parameters: {sorted(unknown)}')
+        return value
+
+
+class SweepResponse(BaseModel):
+    parameters: List[str]
+    points: List[List[float]]
+    outcomes: List[str]
+    probabilities: List[List[float]]
+
+
+class CircuitResponse(BaseModel):
+    state: QuantumStateModel
+    outcomes: List[Dict[str, Optional[int]]]
+    trials: Optional[TrialsResponse] = None
+
+
+class JobRequest(BaseModel):
+    session_id: str
+    kind: Literal['trials', 'circuit']
+    qubit: str = Field('ALL', regex=SCOPE_PATTERN)
+    n: Optional[int] = Field(None, gt=0)
+    operations: List[CircuitOperation] = Field(default_factory=list, max_items=1000000)
+    trials: Optional[int] = Field(None, gt=0)
+    trials_scope: str = Field('ALL', regex=SCOPE_PATTERN)
+    noise: Optional[NoiseParameters] = None
+
+    @validator('trials_scope', always=True)
+    def validate_kind(cls, value: str, values):
+        kind = values.get('kind')
+        if kind == 'trials' and values.get('n') is None:
+            raise ValueError('trials jobs require n')
+        if kind == 'circuit' and not values.get('operations'):
+            raise ValueError('circuit jobs require operations')
+        return value
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    session_id: str
+    kind: str
+    status: Literal['queued', 'running', 'succeeded', 'failed', 'cancelled']
+    progress: float
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+
+
+class JobResultResponse(BaseModel):
+    job_id: str
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class HistoryEntry(BaseModel):
+    id: int
+    action_type: str
+    payload: Optional[Dict[str, Any]] = None
+    created_at: str
+
+
+class HistoryResponse(BaseModel):
+    items: List[HistoryEntry]
+    next_cursor: Optional[int] = None
+
+
+class TrialsRecord(BaseModel):
+    id: int
+    scope: str
+    n: int
+    counts: Dict[str, int]
+    freqs: Dict[str, float]
+    created_at: str
+
+
+class TrialsHistoryResponse(BaseModel):
+    items: List[TrialsRecord]
+    next_cursor: Optional[int] = None
+
+
+class ReplayResponse(BaseModel):
+    action_id: int
+    snapshot_action_id: Optional[int] = None
+    events_replayed: int
+    state: QuantumStateModel
+
+
+class BulkStateRequest(BaseModel):
+    session_ids: List[str] = Field(..., min_items=1, max_items=10000)
+
+
+class BulkStateResponse(BaseModel):
+    states: Dict[str, QuantumStateModel]
+    missing: List[str] = []
+
+
+class BulkGateItem(BaseModel):
+    session_id: str
+    gate: GateName
+    qubits: Optional[List[QubitRef]] = None
+    theta: Optional[float] = None
+
+    _check_theta = validator('theta', always=True, allow_reuse=True)(_check_theta)
+
+
+class BulkGateRequest(BaseModel):
+    items: List[BulkGateItem] = Field(..., min_items=1, max_items=10000)
+
+    @validator('items')
+    def validate_unique(cls, value: List[BulkGateItem]):
+        seen = set()
+        for item in value:
+            if item.session_id in seen:
+                raise ValueError(f'session {item.session_id} appears more than once')
+            seen.add(item.session_id)
+        return value
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import quantum
+from .config import settings
+from .models import CircuitOperation
+from .rng import Generator, get_rng
+from .utils import basis_label, normalize_batch
+
+Y = np.array([[0, -1j], [1j, 0]], dtype=np.complex128)
+Z = np.diag([1, -1]).astype(np.complex128)
+PAULIS = (quantum.X, Y, Z)
+
+
+@dataclass(frozen=True)
+class NoiseModel:
+    """Per-gate channels applied to every qubit a gate touches, plus readout error.
+
+    ``depolarizing`` is the probability of a uniformly random X/Y/Z error,
+    ``amplitude_damping`` the decay probability of an excited qubit, and
+    ``readout_error`` the chance each measured bit is reported flipped.
+    """
+
+    depolarizing: float = 0.0
+    amplitude_damping: float = 0.0
+    readout_error: float = 0.0
+
+    @property
+    def gate_noise(self) -> bool:
+        return self.depolarizing > 0 or self.amplitude_damping > 0
+
+
+def resolve(override: Optional[Mapping[str, Any]] = None) -> NoiseModel:
+    # Requests may carry their own model; otherwise the server-wide defaults apply.
+    if override is not None:
+        return NoiseModel(**override)
+    return NoiseModel(
+        depolarizing=settings.noise_depolarizing,
+        amplitude_damping=settings.noise_amplitude_damping,
+        readout_error=settings.noise_readout_error,
+    )
+
+
+def depolarize(states: np.ndarray, qubit: int, probability: float, rng: Generator) -> np.ndarray:
+    if probability <= 0:
+        return states
+    draws = rng.random(len(states))
+    hit = draws < probability
+    kinds = np.minimum((draws * 3 / probability).astype(np.int64), 2)
+    for kind, pauli in enumerate(PAULIS):
+        rows = np.flatnonzero(hit & (kinds == kind))
+        if rows.size:
+            states[rows] = quantum.apply_matrix(states[rows], pauli, (qubit,))
+    return states
+
+
+def damp(states: np.ndarray, qubit: int, gamma: float, rng: Generator) -> np.ndarray:
+    # Trajectory unravelling of amplitude damping: a row decays (K1) with
+    # probability gamma * P(qubit = 1), otherwise its |1> branch shrinks (K0).
+    if gamma <= 0:
+        return states
+    view = states.reshape(len(states), 1 << qubit, 2, -1)
+    excited = (np.abs(view[:, :, 1, :]) ** 2).sum(axis=(1, 2))
+    jumps = rng.random(len(states)) < gamma * excited
+    view[jumps, :, 0, :] = view[jumps, :, 1, :]
+    view[jumps, :, 1, :] = 0
+    view[~jumps, :, 1, :] *= np.sqrt(1 - gamma)
+    return normalize_batch(view.reshape(states.shape))
+
+
+def _evolve(
+    states: np.ndarray, operations: Sequence[CircuitOperation], model: NoiseModel, rng: Generator
+) -> np.ndarray:
+    count = quantum.num_qubits(states)
+    for operation in operations:
+        if operation.type == 'gate':
+            targets = quantum.gate_qubits(operation.gate, operation.qubits, count)
+            states = quantum.apply_gate_batch(states, operation.gate, targets, operation.theta)
+            for qubit in targets:
+                states = depolarize(states, qubit, model.depolarizing, rng)
+                states = damp(states, qubit, model.amplitude_damping, rng)
+        elif operation.type == 'measure' and operation.qubit in ('BOTH', 'ALL'):
+            _, states = quantum.measure_all_batch(states, rng)
+        elif operation.type == 'measure':
+            _, states = quantum.measure_qubit_batch(states, operation.qubit, rng)
+        elif operation.type == 'reset':
+            states = quantum.reset_qubit_batch(states, operation.qubit)
+        elif operation.type == 'hard_reset':
+            states = np.tile(quantum.initial_state(count), (len(states), 1))
+    return states
+
+
+def _read(states: np.ndarray, scope: str, readout_error: float, rng: Generator) -> np.ndarray:
+    # One shot per trajectory, then independent bit flips for readout error.
+    count = quantum.num_qubits(states)
+    cumulative = np.cumsum(np.abs(states) ** 2, axis=1)
+    thresholds = rng.random(len(states)) * cumulative[:, -1]
+    indices = np.minimum((cumulative < thresholds[:, None]).sum(axis=1), cumulative.shape[1] - 1)
+    width = count
+    if scope not in ('BOTH', 'ALL'):
+        width = 1
+        indices = (indices >> (count - 1 - quantum.qubit_index(scope, count))) & 1
+    if readout_error > 0:
+        flips = rng.random((len(indices), width)) < readout_error
+        indices = indices ^ (flips @ (1 << np.arange(width - 1, -1, -1)))
+    return np.bincount(indices, minlength=1 << width)
+
+
+def run_trials(
+    state: np.ndarray,
+    operations: Sequence[CircuitOperation],
+    scope: str,
+    n: int,
+    model: NoiseModel,
+    rng: Optional[Generator] = None,
+) -> Tuple[Dict[str, int], Dict[str, float]]:
+    """Sample ``n`` noisy shots of ``operations`` applied to ``state``.
+
+    Each shot is an independent Monte-Carlo trajectory; trajectories advance
+    together as a ``(shots, 2^n)`` stack, in batches bounded by
+    ``QUANTUM_NOISE_BATCH_AMPLITUDES``.
+    """
+    if n <= 0:
+        raise ValueError("Number of trials must be positive")
+    rng = rng or get_rng()
+    width = quantum.num_qubits(state) if scope in ('BOTH', 'ALL') else 1
+    batch = max(settings.noise_batch_amplitudes // state.size, 1)
+    drawn = np.zeros(1 << width, dtype=np.int64)
+    for start in range(0, n, batch):
+        states = np.tile(state, (min(batch, n - start), 1))
+        drawn += _read(_evolve(states, operations, model, rng), scope, model.readout_error, rng)
+    result = {basis_label(int(index), width): int(drawn[index]) for index in np.flatnonzero(drawn)}
+    return result, {key: value / n for key, value in result.items()}
@@ -1,18 +1,32 @@
 from __future__ import annotations
 
-from typing import Dict, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from threading import local
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple, Union
 
 import numpy as np
 
-from .utils import BASIS_STATES, normalize, probabilities_from_amplitudes, sample_index
+from .rng import Generator, get_rng
+from .utils import (
+    AMPLITUDE_EPSILON,
+    apply_readout_error,
+    basis_label,
+    confidence_intervals,
+    iter_sample_counts,
+    normalize,
+    normalize_batch,
+    qubit_labels,
+    sample_counts,
+)
+
+MAX_QUBITS = 25
+PROJECTOR_TABLE_QUBITS = 10
 
 H = (1 / np.sqrt(2)) * np.array([[1, 1], [1, -1]], dtype=np.complex128)
 X = np.array([[0, 1], [1, 0]], dtype=np.complex128)
 I2 = np.eye(2, dtype=np.complex128)
 
-H_Q1 = np.kron(H, I2)
-X_Q1 = np.kron(X, I2)
-
 CNOT = np.array(
     [
         [1, 0, 0, 0],
@@ -23,106 +37,485 @@ CNOT = np.array(
     dtype=np.complex128,
 )
 
+# Native (unembedded) gate matrices; qubit 0 (Q1) is the most significant bit.
 GATE_MATRICES = {
-    "H": H_Q1,
-    "X": X_Q1,
+    "H": H,
+    "X": X,
     "CNOT": CNOT,
 }
 
+# Rotation (RX/RY/RZ), phase (P) and controlled-phase (CP) gates take an angle theta.
+PARAMETRIC_GATES = {
+    "RX": 1,
+    "RY": 1,
+    "RZ": 1,
+    "P": 1,
+    "CP": 2,
+}
+
+GATE_ARITY = {
+    **{name: matrix.shape[0].bit_length() - 1 for name, matrix in GATE_MATRICES.items()},
+    **PARAMETRIC_GATES,
+}
 
-def initial_state() -> np.ndarray:
-    return np.array([1, 0, 0, 0], dtype=np.complex128)
+# Targets used when a request does not name qubits: the two-qubit playground
+# applies single-qubit gates to Q1 and two-qubit gates from Q1 onto Q2.
+DEFAULT_QUBITS = {name: (0,) if arity == 1 else (0, 1) for name, arity in GATE_ARITY.items()}
 
+Qubit = Union[int, str]
+
+
+def num_qubits(state: np.ndarray) -> int:
+    size = state.shape[-1]
+    count = size.bit_length() - 1
+    if size != 1 << count:
+        raise ValueError("State vector length must be a power of two")
+    return count
+
+
+def qubit_index(qubit: Qubit, count: int) -> int:
+    if isinstance(qubit, str):
+        if not (qubit.startswith("Q") and qubit[1:].isdigit()):
+            raise ValueError(f"Invalid qubit: {qubit}")
+        index = int(qubit[1:]) - 1
+    else:
+        index = int(qubit)
+    if not 0 <= index < count:
+        raise ValueError(f"Qubit {qubit} is out of range for a {count}-qubit state")
+    return index
 
-def apply_gate_to_state(state: np.ndarray, gate: str) -> np.ndarray:
-    if gate not in GATE_MATRICES:
+
+def gate_qubits(gate: str, qubits: Optional[Sequence[Qubit]], count: int) -> Tuple[int, ...]:
+    if gate not in GATE_ARITY:
+        raise ValueError(f"Unsupported gate: {gate}")
+    targets = tuple(qubit_index(q, count) for q in (qubits if qubits is not None else DEFAULT_QUBITS[gate]))
+    arity = GATE_ARITY[gate]
+    if len(targets) != arity:
+        raise ValueError(f"Gate {gate} acts on {arity} qubit(s), got {len(targets)}")
+    if len(set(targets)) != len(targets):
+        raise ValueError("Gate qubits must be distinct")
+    return targets
+
+
+def gate_matrices(gate: str, thetas: np.ndarray) -> np.ndarray:
+    """Stack of ``gate`` matrices, one per angle in ``thetas``.
+
+    Trigonometric terms are evaluated once per distinct angle, so a sweep grid
+    only pays for its unique values.
+    """
+    unique, inverse = np.unique(np.asarray(thetas, dtype=np.float64), return_inverse=True)
+    half = unique / 2
+    if gate == "RX":
+        cos, sin = np.cos(half), np.sin(half)
+        table = np.stack([np.stack([cos, -1j * sin], -1), np.stack([-1j * sin, cos], -1)], -2)
+    elif gate == "RY":
+        cos, sin = np.cos(half), np.sin(half)
+        table = np.stack([np.stack([cos, -sin], -1), np.stack([sin, cos], -1)], -2).astype(np.complex128)
+    elif gate == "RZ":
+        table = np.zeros((len(unique), 2, 2), dtype=np.complex128)
+        table[:, 0, 0] = np.exp(-1j * half)
+        table[:, 1, 1] = np.exp(1j * half)
+    elif gate in ("P", "CP"):
+        size = 1 << PARAMETRIC_GATES[gate]
+        table = np.zeros((len(unique), size, size), dtype=np.complex128)
+        table[:, np.arange(size - 1), np.arange(size - 1)] = 1
+        table[:, -1, -1] = np.exp(1j * unique)
+    else:
+        raise ValueError(f"Gate {gate} does not take an angle")
+    return table[inverse.reshape(-1)]
+
+
+@lru_cache(maxsize=4096)
+def gate_matrix(gate: str, theta: Optional[float] = None) -> np.ndarray:
+    if gate in GATE_MATRICES:
+        return GATE_MATRICES[gate]
+    if gate not in PARAMETRIC_GATES:
         raise ValueError(f"Unsupported gate: {gate}")
-    matrix = GATE_MATRICES[gate]
-    new_state = matrix @ state
+    if theta is None:
+        raise ValueError(f"Gate {gate} requires an angle theta")
+    matrix = gate_matrices(gate, np.array([theta]))[0]
+    matrix.setflags(write=False)
+    return matrix
+
+
+def initial_state(count: int = 2) -> np.ndarray:
+    if not 1 <= count <= MAX_QUBITS:
+        raise ValueError(f"Number of qubits must be between 1 and {MAX_QUBITS}")
+    state = np.zeros(1 << count, dtype=np.complex128)
+    state[0] = 1
+    return state
+
+
+def apply_matrix(state: np.ndarray, matrix: np.ndarray, qubits: Sequence[int]) -> np.ndarray:
+    # Leading axes, if any, index a stack of independent states.
+    count = num_qubits(state)
+    batch = state.shape[:-1]
+    if len(qubits) == 1:
+        # View the state as (high bits, target bit, low bits) and mix the two halves.
+        target = qubits[0]
+        result = np.array(state, dtype=np.complex128)
+        view = result.reshape(batch + (1 << target, 2, -1))
+        zero = view[..., 0, :].copy()
+        one = view[..., 1, :]
+        view[..., 0, :] = matrix[0, 0] * zero + matrix[0, 1] * one
+        view[..., 1, :] = matrix[1, 0] * zero + matrix[1, 1] * one
+        return result
+    arity = len(qubits)
+    axes = tuple(len(batch) + q for q in qubits)
+    tensor = np.asarray(state, dtype=np.complex128).reshape(batch + (2,) * count)
+    operator = matrix.reshape((2,) * (2 * arity))
+    contracted = np.tensordot(operator, tensor, axes=(tuple(range(arity, 2 * arity)), axes))
+    return np.moveaxis(contracted, tuple(range(arity)), axes).reshape(batch + (-1,))
+
+
+def apply_matrix_rows(states: np.ndarray, matrices: np.ndarray, qubits: Sequence[int]) -> np.ndarray:
+    # Row i of the (k, 2^n) stack is evolved by matrices[i].
+    count = num_qubits(states)
+    if len(qubits) == 1:
+        result = np.array(states, dtype=np.complex128)
+        view = result.reshape((-1, 1 << qubits[0], 2, 1 << (count - 1 - qubits[0])))
+        zero = view[:, :, 0, :].copy()
+        one = view[:, :, 1, :]
+        m = matrices[:, :, :, None, None]
+        view[:, :, 0, :] = m[:, 0, 0] * zero + m[:, 0, 1] * one
+        view[:, :, 1, :] = m[:, 1, 0] * zero + m[:, 1, 1] * one
+        return result
+    arity = len(qubits)
+    axes = tuple(1 + q for q in qubits)
+    tensor = np.asarray(states, dtype=np.complex128).reshape((-1,) + (2,) * count)
+    tensor = np.moveaxis(tensor, axes, range(1, arity + 1))
+    shape = tensor.shape
+    evolved = np.einsum("kij,kjr->kir", matrices, tensor.reshape(shape[0], 1 << arity, -1))
+    return np.moveaxis(evolved.reshape(shape), range(1, arity + 1), axes).reshape(states.shape)
+
+
+def apply_gate_to_state(
+    state: np.ndarray, gate: str, qubits: Optional[Sequence[Qubit]] = None, theta: Optional[float] = None
+) -> np.ndarray:
+    targets = gate_qubits(gate, qubits, num_qubits(state))
+    new_state = apply_matrix(state, gate_matrix(gate, theta), targets)
     return normalize(new_state)
 
 
-def measure_qubit(state: np.ndarray, qubit: str) -> Tuple[int, np.ndarray]:
-    if qubit not in ("Q1", "Q2"):
-        raise ValueError("qubit must be Q1 or Q2")
-
-    amplitudes = state.copy()
-    if qubit == "Q1":
-        prob0 = abs(amplitudes[0]) ** 2 + abs(amplitudes[1]) ** 2
-        prob1 = abs(amplitudes[2]) ** 2 + abs(amplitudes[3]) ** 2
-        probabilities = [prob0, prob1]
-        choice = sample_index(probabilities)
-        if choice == 0:
-            collapsed = np.array([amplitudes[0], amplitudes[1], 0, 0], dtype=np.complex128)
-        else:
-            collapsed = np.array([0, 0, amplitudes[2], amplitudes[3]], dtype=np.complex128)
+def apply_gate_batch(
+    states: np.ndarray, gate: str, qubits: Optional[Sequence[Qubit]] = None, theta: Optional[float] = None
+) -> np.ndarray:
+    targets = gate_qubits(gate, qubits, num_qubits(states))
+    return normalize_batch(apply_matrix(states, gate_matrix(gate, theta), targets))
+
+
+@dataclass(frozen=True)
+class OperatorTable:
+    """Precomputed measurement/reset operators for one qubit count.
+
+    Small registers keep dense projector diagonals so a marginal is one dot
+    product and a collapse one multiply. Wider registers, where those tables
+    would cost O(n * 2^n) memory, use (high bits, qubit, low bits) views.
+    """
+
+    count: int
+    size: int
+    shapes: Tuple[Tuple[int, int, int], ...]
+    fallback: Tuple[Tuple[int, int], ...]
+    labels: Dict[str, int]
+    projectors: Optional[np.ndarray]
+    marginals: Optional[np.ndarray]
+
+
+@lru_cache(maxsize=None)
+def operator_table(count: int) -> OperatorTable:
+    shapes = tuple((1 << q, 2, 1 << (count - 1 - q)) for q in range(count))
+    projectors = marginals = None
+    if count <= PROJECTOR_TABLE_QUBITS:
+        projectors = np.zeros((count, 2, 1 << count), dtype=np.float64)
+        for q, shape in enumerate(shapes):
+            view = projectors[q].reshape(2, *shape)
+            view[0, :, 0, :] = 1
+            view[1, :, 1, :] = 1
+        marginals = np.ascontiguousarray(projectors.transpose(0, 2, 1))
+        projectors.setflags(write=False)
+        marginals.setflags(write=False)
+    return OperatorTable(
+        count=count,
+        size=1 << count,
+        shapes=shapes,
+        fallback=tuple((0, 1 << (count - 1 - q)) for q in range(count)),
+        labels={label: q for q, label in enumerate(qubit_labels(count))},
+        projectors=projectors,
+        marginals=marginals,
+    )
+
+
+operator_table(2)
+
+_scratch = local()
+
+
+def _weights(state: np.ndarray) -> np.ndarray:
+    # |amplitude|^2 into a per-thread buffer reused across calls. Only small
+    # registers keep one: a 25-qubit buffer would pin 256 MB in every thread.
+    if state.size > 1 << PROJECTOR_TABLE_QUBITS:
+        return np.square(np.abs(state))
+    buffers = getattr(_scratch, "buffers", None)
+    if buffers is None:
+        buffers = _scratch.buffers = {}
+    buffer = buffers.get(state.size)
+    if buffer is None:
+        buffer = buffers[state.size] = np.empty(state.size, dtype=np.float64)
+    np.abs(state, out=buffer)
+    np.square(buffer, out=buffer)
+    return buffer
+
+
+def _output(state: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+    # ``out`` is for callers that own a buffer (benchmarks, batch loops). The
+    # API paths leave it unset because session vectors may be shared with the cache.
+    if out is None:
+        return np.array(state, dtype=np.complex128)
+    if out is not state:
+        np.copyto(out, state)
+    return out
+
+
+def _resolve(state: np.ndarray, qubit: Qubit) -> Tuple[OperatorTable, int]:
+    table = operator_table(num_qubits(state))
+    index = table.labels.get(qubit) if isinstance(qubit, str) else None
+    if index is None:
+        index = qubit_index(qubit, table.count)
+    return table, index
+
+
+def _marginal(halves: np.ndarray) -> Tuple[float, float]:
+    # Summing each half separately stays contiguous-friendly for every qubit position.
+    return float(halves[:, 0, :].sum()), float(halves[:, 1, :].sum())
+
+
+def qubit_probabilities(state: np.ndarray, qubit: Qubit) -> np.ndarray:
+    table, index = _resolve(state, qubit)
+    weights = _weights(state)
+    if table.marginals is not None:
+        return weights @ table.marginals[index]
+    return np.array(_marginal(weights.reshape(table.shapes[index])))
+
+
+def _project(
+    state: np.ndarray, table: OperatorTable, index: int, choice: int, probability: float, out: Optional[np.ndarray]
+) -> np.ndarray:
+    if probability == 0:
+        collapsed = np.empty(table.size, dtype=np.complex128) if out is None else out
+        collapsed[:] = 0
+        collapsed[table.fallback[index][choice]] = 1
+    elif table.projectors is not None:
+        collapsed = np.empty(table.size, dtype=np.complex128) if out is None else out
+        np.multiply(state, table.projectors[index, choice], out=collapsed)
+        collapsed *= 1 / np.sqrt(probability)
+    else:
+        collapsed = _output(state, out)
+        collapsed.reshape(table.shapes[index])[:, 1 - choice, :] = 0
+        collapsed *= 1 / np.sqrt(probability)
+    return collapsed
+
+
+def measure_qubit(
+    state: np.ndarray, qubit: Qubit, rng: Optional[Generator] = None, out: Optional[np.ndarray] = None
+) -> Tuple[int, np.ndarray]:
+    table, index = _resolve(state, qubit)
+    weights = _weights(state)
+    if table.marginals is not None:
+        prob0, prob1 = (weights @ table.marginals[index]).tolist()
     else:
-        prob0 = abs(amplitudes[0]) ** 2 + abs(amplitudes[2]) ** 2
-        prob1 = abs(amplitudes[1]) ** 2 + abs(amplitudes[3]) ** 2
-        probabilities = [prob0, prob1]
-        choice = sample_index(probabilities)
-        if choice == 0:
-            collapsed = np.array([amplitudes[0], 0, amplitudes[2], 0], dtype=np.complex128)
-        else:
-            collapsed = np.array([0, amplitudes[1], 0, amplitudes[3]], dtype=np.complex128)
-
-    if probabilities[choice] == 0:
-        collapsed = np.zeros_like(collapsed)
-        if qubit == "Q1":
-            collapsed[0 if choice == 0 else 2] = 1
-        else:
-            collapsed[0 if choice == 0 else 1] = 1
-    normalized = normalize(collapsed)
-    return choice, normalized
-
-
-def measure_both(state: np.ndarray) -> Tuple[Dict[str, int], np.ndarray]:
-    amplitudes = state.copy()
-    probabilities = probabilities_from_amplitudes(amplitudes)
-    index = sample_index(probabilities)
-    basis = BASIS_STATES[index]
-    collapsed = np.zeros_like(amplitudes)
+        prob0, prob1 = _marginal(weights.reshape(table.shapes[index]))
+    total = prob0 + prob1
+    if total <= 0:
+        raise ValueError("Invalid probability distribution")
+    choice = 0 if (rng or get_rng()).random() * total <= prob0 else 1
+    return choice, _project(state, table, index, choice, prob1 if choice else prob0, out)
+
+
+def collapse_qubit(state: np.ndarray, qubit: Qubit, outcome: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    # Deterministic counterpart of measure_qubit for a recorded outcome.
+    if outcome not in (0, 1):
+        raise ValueError(f"Invalid measurement outcome: {outcome}")
+    table, index = _resolve(state, qubit)
+    probability = float(qubit_probabilities(state, index)[outcome])
+    return _project(state, table, index, outcome, probability, out)
+
+
+def collapse_all(count: int, outcome: Dict[str, int]) -> np.ndarray:
+    index = 0
+    for label in qubit_labels(count):
+        index = (index << 1) | int(outcome[label])
+    state = np.zeros(1 << count, dtype=np.complex128)
+    state[index] = 1.0
+    return state
+
+
+def measure_all(
+    state: np.ndarray, rng: Optional[Generator] = None, out: Optional[np.ndarray] = None
+) -> Tuple[Dict[str, int], np.ndarray]:
+    table = operator_table(num_qubits(state))
+    weights = _weights(state)
+    cumulative = np.cumsum(weights, out=weights)
+    threshold = (rng or get_rng()).random() * cumulative[-1]
+    index = min(int(np.searchsorted(cumulative, threshold, side="left")), table.size - 1)
+    collapsed = np.zeros(table.size, dtype=np.complex128) if out is None else out
+    collapsed[:] = 0
     collapsed[index] = 1.0
-    collapsed = normalize(collapsed)
-    return {"Q1": int(basis[0]), "Q2": int(basis[1])}, collapsed
-
-
-def reset_qubit(state: np.ndarray, qubit: str) -> np.ndarray:
-    amplitudes = state.copy()
-    if qubit == "Q1":
-        new00 = amplitudes[0] + amplitudes[2]
-        new01 = amplitudes[1] + amplitudes[3]
-        collapsed = np.array([new00, new01, 0, 0], dtype=np.complex128)
-    elif qubit == "Q2":
-        new00 = amplitudes[0] + amplitudes[1]
-        new10 = amplitudes[2] + amplitudes[3]
-        collapsed = np.array([new00, 0, new10, 0], dtype=np.complex128)
+    basis = basis_label(index, table.count)
+    return {label: int(bit) for label, bit in zip(table.labels, basis)}, collapsed
+
+
+def measure_both(state: np.ndarray, rng: Optional[Generator] = None) -> Tuple[Dict[str, int], np.ndarray]:
+    return measure_all(state, rng)
+
+
+def reset_qubit(state: np.ndarray, qubit: Qubit, out: Optional[np.ndarray] = None) -> np.ndarray:
+    table, index = _resolve(state, qubit)
+    collapsed = _output(state, out)
+    halves = collapsed.reshape(table.shapes[index])
+    halves[:, 0, :] += halves[:, 1, :]
+    halves[:, 1, :] = 0
+    norm = float(np.sqrt(_weights(collapsed).sum()))
+    if norm <= 1e-8:
+        collapsed[:] = 0
+        collapsed[0] = 1
+        return collapsed
+    collapsed /= norm
+    return collapsed
+
+
+def hard_reset(count: int = 2) -> np.ndarray:
+    return initial_state(count)
+
+
+def _stack(states: np.ndarray) -> np.ndarray:
+    if states.ndim != 2:
+        raise ValueError("Batch kernels expect a (k, 2^n) stack of state vectors")
+    return np.array(states, dtype=np.complex128)
+
+
+def measure_qubit_batch(
+    states: np.ndarray, qubit: Qubit, rng: Optional[Generator] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    # One uniform per row; returns the per-row outcomes and the collapsed, renormalized stack.
+    collapsed = _stack(states)
+    table, index = _resolve(collapsed, qubit)
+    rows = np.arange(len(collapsed))
+    weights = np.abs(collapsed) ** 2
+    if table.marginals is not None:
+        probabilities = weights @ table.marginals[index]
     else:
-        raise ValueError("qubit must be Q1 or Q2")
-    norm = np.linalg.norm(collapsed)
-    if np.isclose(norm, 0.0):
-        collapsed = initial_state()
-    return normalize(collapsed)
+        halves = weights.reshape((-1,) + table.shapes[index])
+        probabilities = np.stack([halves[:, :, 0, :].sum(axis=(1, 2)), halves[:, :, 1, :].sum(axis=(1, 2))], axis=1)
+    totals = probabilities.sum(axis=1)
+    if not np.all(totals > 0):
+        raise ValueError("Invalid probability distribution")
+    outcomes = ((rng or get_rng()).random(len(collapsed)) * totals > probabilities[:, 0]).astype(np.int64)
+    chosen = probabilities[rows, outcomes]
+
+    view = collapsed.reshape((-1,) + table.shapes[index])
+    view[outcomes == 0, :, 1, :] = 0
+    view[outcomes == 1, :, 0, :] = 0
+    empty = chosen <= 0
+    if np.any(empty):
+        fallback = np.asarray(table.fallback[index])[outcomes[empty]]
+        collapsed[empty] = 0
+        collapsed[np.flatnonzero(empty), fallback] = 1
+        chosen[empty] = 1
+    collapsed /= np.sqrt(chosen)[:, None]
+    return outcomes, collapsed
+
+
+def measure_all_batch(states: np.ndarray, rng: Optional[Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    # Returns each row's sampled basis index and the stack of collapsed basis states.
+    weights = np.abs(_stack(states)) ** 2
+    cumulative = np.cumsum(weights, axis=1)
+    thresholds = (rng or get_rng()).random(len(weights)) * cumulative[:, -1]
+    indices = np.minimum((cumulative < thresholds[:, None]).sum(axis=1), weights.shape[1] - 1)
+    collapsed = np.zeros(weights.shape, dtype=np.complex128)
+    collapsed[np.arange(len(weights)), indices] = 1.0
+    return indices, collapsed
+
 
+def reset_qubit_batch(states: np.ndarray, qubit: Qubit) -> np.ndarray:
+    collapsed = _stack(states)
+    table, index = _resolve(collapsed, qubit)
+    halves = collapsed.reshape((-1,) + table.shapes[index])
+    halves[:, :, 0, :] += halves[:, :, 1, :]
+    halves[:, :, 1, :] = 0
+    norms = np.linalg.norm(collapsed, axis=1)
+    dead = norms <= 1e-8
+    if np.any(dead):
+        collapsed[dead] = 0
+        collapsed[dead, 0] = 1
+        norms[dead] = 1
+    collapsed /= norms[:, None]
+    return collapsed
 
-def hard_reset() -> np.ndarray:
-    return initial_state()
 
+def trial_distribution(state: np.ndarray, scope: str, readout_error: float = 0.0) -> Tuple[int, np.ndarray]:
+    if scope in ("BOTH", "ALL"):
+        return num_qubits(state), apply_readout_error(np.abs(state) ** 2, readout_error)
+    return 1, apply_readout_error(qubit_probabilities(state, scope), readout_error)
 
-def run_trials(state: np.ndarray, scope: str, n: int) -> Tuple[Dict[str, int], Dict[str, float]]:
+
+def run_trials(
+    state: np.ndarray, scope: str, n: int, rng: Optional[Generator] = None, readout_error: float = 0.0
+) -> Tuple[Dict[str, int], Dict[str, float]]:
     if n <= 0:
         raise ValueError("Number of trials must be positive")
-    counts: Dict[str, int] = {}
-    for _ in range(n):
-        working_state = state.copy()
-        if scope == "BOTH":
-            outcome, _ = measure_both(working_state)
-            key = f"{outcome['Q1']}{outcome['Q2']}"
-        elif scope in ("Q1", "Q2"):
-            result, _ = measure_qubit(working_state, scope)
-            key = str(result)
-        else:
-            raise ValueError("Invalid scope for trials")
-        counts[key] = counts.get(key, 0) + 1
+    width, probabilities = trial_distribution(state, scope, readout_error)
+    drawn = sample_counts(probabilities, n, rng)
+    counts = {basis_label(int(index), width): int(drawn[index]) for index in np.flatnonzero(drawn)}
     freqs = {key: value / n for key, value in counts.items()}
     return counts, freqs
+
+
+def stream_trials(
+    state: np.ndarray,
+    scope: str,
+    n: int,
+    every: int,
+    rng: Optional[Generator] = None,
+    readout_error: float = 0.0,
+) -> Iterator[Tuple[int, Dict[str, int], Dict[str, float]]]:
+    if n <= 0:
+        raise ValueError("Number of trials must be positive")
+    if every <= 0:
+        raise ValueError("Progress interval must be positive")
+    width, probabilities = trial_distribution(state, scope, readout_error)
+    for done, drawn in iter_sample_counts(probabilities, n, rng, every):
+        counts = {basis_label(int(index), width): int(drawn[index]) for index in np.flatnonzero(drawn)}
+        yield done, counts, {key: value / done for key, value in counts.items()}
+
+
+def exact_trials(
+    state: np.ndarray,
+    scope: str,
+    n: int,
+    confidence: float = 0.95,
+    sample: bool = False,
+    rng: Optional[Generator] = None,
+    readout_error: float = 0.0,
+) -> Dict[str, Any]:
+    if n <= 0:
+        raise ValueError("Number of trials must be positive")
+    width, probabilities = trial_distribution(state, scope, readout_error)
+    probabilities = probabilities / probabilities.sum()
+    support = np.flatnonzero(probabilities > AMPLITUDE_EPSILON ** 2)
+    labels = [basis_label(int(index), width) for index in support]
+    result: Dict[str, Any] = {
+        "probabilities": {label: float(probabilities[index]) for label, index in zip(labels, support)},
+        "counts": {},
+    }
+    if sample:
+        drawn = (rng or get_rng()).multinomial(n, probabilities)
+        result["counts"] = {label: int(drawn[index]) for label, index in zip(labels, support) if drawn[index]}
+        result["freqs"] = {label: count / n for label, count in result["counts"].items()}
+        observed = drawn[support] / n
+    else:
+        result["freqs"] = dict(result["probabilities"])
+        observed = probabilities[support]
+    intervals = confidence_intervals(observed, n, confidence, observed=sample)
+    result["intervals"] = {label: (float(low), float(high)) for label, (low, high) in zip(labels, intervals)}
+    return result
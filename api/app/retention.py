@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional
+
+from . import db, rng
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _cutoff(seconds: float) -> str:
+    return (datetime.now(UTC) - timedelta(seconds=seconds)).isoformat()
+
+
+class ArchiveWriter:
+    """Appends deleted history rows to gzip-compressed JSON-lines files.
+
+    One file per table and UTC day; every process writes its own file so
+    concurrent workers never interleave inside a gzip member.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def path(self, table: str) -> Path:
+        day = datetime.now(UTC).strftime('%Y%m%d')
+        return self.directory / f'{table}-{day}-{os.getpid()}.jsonl.gz'
+
+    def __call__(self, table: str, rows: List[Dict]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.path(table), 'at', encoding='utf-8') as handle:
+            for row in rows:
+                handle.write(json.dumps(row))
+                handle.write('\n')
+
+
+class RetentionSweeper:
+    """Background thread expiring idle sessions and compacting history.
+
+    Every batch is its own short write transaction, so a sweep never holds
+    the database write lock for long however much it has to delete.
+    """
+
+    def __init__(
+        self,
+        session_ttl: float,
+        history_ttl: float,
+        batch_size: int,
+        vacuum_pages: int,
+        archive_dir: Optional[Path] = None,
+        convert_vacuum: bool = False,
+    ):
+        self.session_ttl = session_ttl
+        self.history_ttl = history_ttl
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.convert_vacuum = convert_vacuum
+        self.archive = ArchiveWriter(archive_dir) if archive_dir is not None else None
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+        self._totals = {'sessions': 0, 'actions': 0, 'trials': 0, 'vacuumed_pages': 0, 'sweeps': 0}
+        self._last_sweep_ms = 0.0
+
+    def sweep(self) -> Dict[str, int]:
+        started = time.perf_counter()
+        removed = {'sessions': 0, 'actions': 0, 'trials': 0, 'vacuumed_pages': 0}
+        if self.session_ttl > 0:
+            cutoff = _cutoff(self.session_ttl)
+            while True:
+                expired = db.delete_idle_sessions(cutoff, self.batch_size)
+                for session_id in expired:
+                    rng.release_session(session_id)
+                removed['sessions'] += len(expired)
+                for table in db.HISTORY_TABLES:
+                    while True:
+                        deleted = db.delete_history(table, self.batch_size, session_ids=expired, archive=self.archive)
+                        removed[table] += deleted
+                        if deleted < self.batch_size:
+                            break
+                if len(expired) < self.batch_size:
+                    break
+        if self.history_ttl > 0:
+            cutoff = _cutoff(self.history_ttl)
+            for table in db.HISTORY_TABLES:
+                while True:
+                    deleted = db.delete_history(table, self.batch_size, before=cutoff, archive=self.archive)
+                    removed[table] += deleted
+                    if deleted < self.batch_size:
+                        break
+        if self.vacuum_pages > 0:
+            removed['vacuumed_pages'] = db.incremental_vacuum(self.vacuum_pages)
+        with self._lock:
+            for key, value in removed.items():
+                self._totals[key] += value
+            self._totals['sweeps'] += 1
+            self._last_sweep_ms = (time.perf_counter() - started) * 1000
+        return removed
+
+    def start(self, interval: float) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, args=(interval,), name='retention-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval: float) -> None:
+        # Converting an existing database rewrites the whole file under the
+        # write lock, so it only happens when an operator asks for it.
+        if self.vacuum_pages > 0 and not db.incremental_vacuum_enabled():
+            if not self.convert_vacuum:
+                logger.info(
+                    'Database is not in incremental auto-vacuum mode; set QUANTUM_RETENTION_CONVERT_VACUUM=true '
+                    'on one worker during a quiet period to convert it'
+                )
+            else:
+                try:
+                    if db.enable_incremental_vacuum():
+                        logger.info('Converted database to incremental auto-vacuum')
+                except Exception:
+                    logger.exception('Could not enable incremental vacuum')
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception('Retention sweep failed')
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {**self._totals, 'last_sweep_ms': self._last_sweep_ms}
+
+
+_sweeper = RetentionSweeper(
+    session_ttl=settings.retention_session_ttl,
+    history_ttl=settings.retention_history_ttl,
+    batch_size=settings.retention_batch_size,
+    vacuum_pages=settings.retention_vacuum_pages,
+    archive_dir=settings.retention_archive_dir,
+    convert_vacuum=settings.retention_convert_vacuum,
+)
+
+
+def start() -> None:
+    if settings.retention_interval > 0:
+        _sweeper.start(settings.retention_interval)
+
+
+def stop() -> None:
+    _sweeper.stop()
+
+
+def sweep() -> Dict[str, int]:
+    return _sweeper.sweep()
+
+
+def metrics() -> Dict[str, float]:
+    return _sweeper.metrics()
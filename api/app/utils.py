@@ -1,31 +1,78 @@
 from __future__ import annotations
 
 import json
-from secrets import SystemRandom
-from typing import Dict, Iterable, List, Sequence, Tuple
+from statistics import NormalDist
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import numpy as np
 
+from .rng import Generator, get_rng
+
 BASIS_STATES: Tuple[str, ...] = ("00", "01", "10", "11")
 
-_rng = SystemRandom()
+STATE_DTYPE = np.dtype("<c16")
 
+SAMPLE_CHUNK_SIZE = 1 << 16
 
-def get_rng() -> SystemRandom:
-    return _rng
+# States wider than this are reported sparsely: only the largest
+# MAX_DICT_AMPLITUDES non-zero amplitudes are included.
+DENSE_VECTOR_QUBITS = 2
+MAX_DICT_AMPLITUDES = 1024
+AMPLITUDE_EPSILON = 1e-12
 
 
 def normalize(vector: np.ndarray) -> np.ndarray:
     norm = np.linalg.norm(vector)
     if norm == 0:
         raise ValueError("State vector cannot be zero")
+    if not np.isfinite(norm):
+        raise ValueError("State vector must be finite")
     return vector / norm
 
 
+def normalize_batch(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    if not np.all(np.isfinite(norms)):
+        raise ValueError("State vector must be finite")
+    if not np.all(norms > 0):
+        raise ValueError("State vector cannot be zero")
+    return vectors / norms
+
+
+def basis_label(index: int, count: int) -> str:
+    return format(index, f"0{count}b")
+
+
+def qubit_labels(count: int) -> Tuple[str, ...]:
+    return tuple(f"Q{index + 1}" for index in range(count))
+
+
 def vector_to_dict(vector: np.ndarray) -> Dict[str, Dict[str, float]]:
+    count = vector.shape[-1].bit_length() - 1
+    if count <= DENSE_VECTOR_QUBITS:
+        indices = np.arange(vector.shape[-1])
+    else:
+        magnitudes = np.abs(vector)
+        indices = np.flatnonzero(magnitudes > AMPLITUDE_EPSILON)
+        if indices.size > MAX_DICT_AMPLITUDES:
+            largest = np.argpartition(magnitudes[indices], -MAX_DICT_AMPLITUDES)[-MAX_DICT_AMPLITUDES:]
+            indices = np.sort(indices[largest])
+    return {
+        basis_label(int(index), count): {"real": float(vector[index].real), "imag": float(vector[index].imag)}
+        for index in indices
+    }
+
+
+def vector_diff(previous: np.ndarray, current: np.ndarray) -> Optional[Dict[str, Dict[str, float]]]:
+    # None when more amplitudes changed than a message may carry; the caller
+    # must then resend the whole state rather than a partial diff.
+    count = current.shape[-1].bit_length() - 1
+    changed = np.flatnonzero(previous != current)
+    if changed.size > MAX_DICT_AMPLITUDES:
+        return None
     return {
-        basis: {"real": float(np.real(value)), "imag": float(np.imag(value))}
-        for basis, value in zip(BASIS_STATES, vector)
+        basis_label(int(index), count): {"real": float(current[index].real), "imag": float(current[index].imag)}
+        for index in changed
     }
 
 
@@ -36,6 +83,12 @@ def dict_to_vector(data: Dict[str, Dict[str, float]]) -> np.ndarray:
     )
 
 
+def json_default(value):
+    if isinstance(value, np.ndarray):
+        return vector_to_dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
 def serialize_state(vector: np.ndarray) -> str:
     payload = vector_to_dict(vector)
     return json.dumps(payload)
@@ -47,18 +100,73 @@ def deserialize_state(payload: str) -> np.ndarray:
     return dict_to_vector(ordered)
 
 
-def sample_index(probabilities: Sequence[float]) -> int:
-    total = sum(probabilities)
+def encode_state(vector: np.ndarray) -> bytes:
+    return np.ascontiguousarray(vector, dtype=STATE_DTYPE).tobytes()
+
+
+def decode_state(payload) -> np.ndarray:
+    if isinstance(payload, str):
+        return deserialize_state(payload)
+    if len(payload) % STATE_DTYPE.itemsize:
+        raise ValueError("Corrupt state payload")
+    return np.frombuffer(payload, dtype=STATE_DTYPE).astype(np.complex128)
+
+
+def apply_readout_error(probabilities: np.ndarray, error: float) -> np.ndarray:
+    # Every measured bit is misread independently with probability `error`.
+    if error <= 0:
+        return probabilities
+    width = len(probabilities).bit_length() - 1
+    tensor = np.asarray(probabilities, dtype=np.float64).reshape((2,) * width)
+    for axis in range(width):
+        tensor = (1 - error) * tensor + error * np.flip(tensor, axis)
+    return tensor.reshape(-1)
+
+
+def iter_sample_counts(
+    probabilities: Sequence[float], n: int, rng: Optional[Generator] = None, every: int = SAMPLE_CHUNK_SIZE
+) -> Iterator[Tuple[int, np.ndarray]]:
+    # One cumulative search per chunk of uniforms keeps memory bounded for any n;
+    # the running histogram is yielded after every `every` shots.
+    cumulative = np.cumsum(np.asarray(probabilities, dtype=np.float64))
+    total = cumulative[-1] if cumulative.size else 0.0
     if total <= 0:
         raise ValueError("Invalid probability distribution")
-    normalized = [p / total for p in probabilities]
-    threshold = get_rng().random()
-    cumulative = 0.0
-    for index, probability in enumerate(normalized):
-        cumulative += probability
-        if threshold <= cumulative:
-            return index
-    return len(probabilities) - 1
+    rng = rng or get_rng()
+    counts = np.zeros(cumulative.size, dtype=np.int64)
+    done = 0
+    while done < n:
+        size = min(n - done, every - done % every, SAMPLE_CHUNK_SIZE)
+        thresholds = rng.random(size) * total
+        indices = np.searchsorted(cumulative, thresholds, side="left")
+        counts += np.bincount(np.minimum(indices, cumulative.size - 1), minlength=cumulative.size)
+        done += size
+        if done % every == 0 or done == n:
+            yield done, counts
+
+
+def sample_counts(probabilities: Sequence[float], n: int, rng: Optional[Generator] = None) -> np.ndarray:
+    counts = np.zeros(len(probabilities), dtype=np.int64)
+    for _, counts in iter_sample_counts(probabilities, n, rng, every=max(n, 1)):
+        pass
+    return counts
+
+
+def confidence_intervals(
+    probabilities: np.ndarray, n: int, confidence: float, observed: bool
+) -> np.ndarray:
+    # Observed frequencies get Wilson score intervals for the true probability;
+    # exact probabilities get the normal-approximation range of an n-shot frequency.
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = np.asarray(probabilities, dtype=np.float64)
+    if observed:
+        denominator = 1 + z * z / n
+        centre = (p + z * z / (2 * n)) / denominator
+        half_width = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    else:
+        centre = p
+        half_width = z * np.sqrt(p * (1 - p) / n)
+    return np.clip(np.stack([centre - half_width, centre + half_width], axis=-1), 0.0, 1.0)
 
 
 def probabilities_from_amplitudes(vector: np.ndarray) -> List[float]:
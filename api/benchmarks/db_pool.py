@@ -0,0 +1,77 @@
+"""Compare per-operation connections with the pooled WAL connection layer.
+
+Run from ``api/``::
+
+    python -m benchmarks.db_pool --threads 8 --requests 200
+
+Each simulated request performs the same database work as ``/api/gate/apply``
+(fetch, state update, action log) with the session cache disabled.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+os.environ.setdefault('QUANTUM_DB_PATH', str(Path(tempfile.mkdtemp(prefix='quantum-bench-')) / 'quantum.db'))
+os.environ['QUANTUM_SESSION_CACHE_MODE'] = 'off'
+
+from app import db, quantum  # noqa: E402
+from app.config import settings  # noqa: E402
+
+
+def legacy_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(settings.db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def simulate_request(session_id: str) -> None:
+    vector, _ = db.fetch_session(session_id)
+    new_vector = quantum.apply_gate_to_state(vector, 'H')
+    db.update_session_state(session_id, new_vector, {'Q1': False, 'Q2': False}, {'Q1': None, 'Q2': None})
+    db.log_action(session_id, 'GATE', {'gate': 'H'})
+
+
+def run(threads: int, requests: int) -> float:
+    sessions = [db.create_session().session_id for _ in range(threads)]
+
+    def worker(session_id: str) -> None:
+        for _ in range(requests):
+            simulate_request(session_id)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, sessions))
+    elapsed = time.perf_counter() - started
+    return threads * requests / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    pooled_get_connection = db.get_connection
+    db.get_connection = legacy_connection
+    with db.get_connection() as conn:
+        conn.execute('PRAGMA journal_mode = DELETE')
+    db.init_db()
+    before = run(args.threads, args.requests)
+
+    db.get_connection = pooled_get_connection
+    db.init_db()
+    after = run(args.threads, args.requests)
+    db.close_connections()
+
+    print(f'per-operation connections: {before:8.1f} req/s')
+    print(f'pooled WAL connections:    {after:8.1f} req/s ({after / before:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Microbenchmarks for the measurement and reset hot path.
+
+Run from ``api/``::
+
+    python -m benchmarks.measurement --qubits 2 --number 200000 --batch 1024
+"""
+from __future__ import annotations
+
+import argparse
+import timeit
+
+import numpy as np
+
+from app import quantum, rng
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--qubits', type=int, default=2)
+    parser.add_argument('--number', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=1024)
+    args = parser.parse_args()
+
+    generator = rng.create_rng('philox', seed=1)
+    state = quantum.initial_state(args.qubits)
+    for qubit in range(args.qubits):
+        state = quantum.apply_gate_to_state(state, 'H', [qubit])
+    last = f'Q{args.qubits}'
+
+    cases = {
+        'measure_qubit': lambda: quantum.measure_qubit(state, last, generator),
+        'measure_all': lambda: quantum.measure_all(state, generator),
+        'reset_qubit': lambda: quantum.reset_qubit(state, last),
+    }
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=args.number, repeat=3))
+        print(f'{name:14s} {seconds / args.number * 1e6:8.2f} us/call')
+
+    # Per-state cost of the stacked kernels against looping the single-state ones.
+    stack = np.stack([state] * args.batch)
+    number = max(args.number // args.batch, 1)
+    batched = {
+        'measure_qubit': (
+            lambda: [quantum.measure_qubit(row, last, generator) for row in stack],
+            lambda: quantum.measure_qubit_batch(stack, last, generator),
+        ),
+        'measure_all': (
+            lambda: [quantum.measure_all(row, generator) for row in stack],
+            lambda: quantum.measure_all_batch(stack, generator),
+        ),
+        'reset_qubit': (
+            lambda: [quantum.reset_qubit(row, last) for row in stack],
+            lambda: quantum.reset_qubit_batch(stack, last),
+        ),
+    }
+    for name, (loop, batch) in batched.items():
+        loop_us, batch_us = (
+            min(timeit.repeat(case, number=number, repeat=3)) / number / args.batch * 1e6 for case in (loop, batch)
+        )
+        print(f'{name:14s} x{args.batch}: loop {loop_us:8.3f} us/state, batch {batch_us:8.3f} us/state')
+
+
+if __name__ == '__main__':
+    main()
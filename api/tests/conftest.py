@@ -1,7 +1,9 @@
 """Pytest configuration installing offline stubs when dependencies are missing."""
 
 from pathlib import Path
+import os
 import sys
+import tempfile
 
 ROOT = Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
@@ -13,3 +15,5 @@ if str(API_ROOT) not in sys.path:
 from offline.stubs import ensure_dependencies
 
 ensure_dependencies()
+
+os.environ.setdefault("QUANTUM_DB_PATH", str(Path(tempfile.mkdtemp(prefix="quantum-tests-")) / "quantum.db"))
@@ -1,11 +1,22 @@
+import json
+import math
+import os
+import time
+from threading import Event
+
+import pytest
 from fastapi.testclient import TestClient
 
 from app.main import app
 
-client = TestClient(app)
+
+@pytest.fixture(scope='module')
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
 
 
-def test_session_lifecycle():
+def test_session_lifecycle(client):
     response = client.post('/api/session/new')
     assert response.status_code == 200
     data = response.json()
@@ -32,3 +43,503 @@ def test_session_lifecycle():
 
     hard_reset_response = client.post('/api/reset/hard', json={'session_id': session_id})
     assert hard_reset_response.status_code == 200
+
+
+def test_seeded_sessions_reproduce_trials(client):
+    results = []
+    for _ in range(2):
+        session_id = client.post('/api/session/new', json={'rng': 'philox', 'seed': 11}).json()['session_id']
+        client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'H'})
+        trials = client.post('/api/trials', json={'session_id': session_id, 'qubit': 'Q1', 'n': 1000})
+        results.append(trials.json()['counts'])
+    assert results[0] == results[1]
+
+
+def test_invalid_rng_overrides_create_no_session(client, monkeypatch):
+    from app import db
+    from app.config import settings
+
+    def sessions():
+        with db.get_connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    monkeypatch.setattr(settings, 'rng_backend', 'secure')
+    before = sessions()
+    for body in ({'seed': 5}, {'rng': 'philox', 'seed': -1}, {'rng': 'secure', 'seed': 1}):
+        assert client.post('/api/session/new', json=body).status_code == 422
+    monkeypatch.setattr(settings, 'web_concurrency', 2)
+    assert client.post('/api/session/new', json={'rng': 'philox', 'seed': 3}).status_code == 400
+    assert sessions() == before
+    assert client.post('/api/session/new', json={'num_qubits': 3}).status_code == 200
+
+
+def test_metrics_report_audit_log(client):
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert 'queue_depth' in response.json()['audit_log']
+
+
+def test_multi_qubit_session_targets_qubits(client):
+    session = client.post('/api/session/new', json={'num_qubits': 5}).json()
+    session_id = session['session_id']
+    assert session['state']['num_qubits'] == 5
+
+    client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'H', 'qubits': [2]})
+    response = client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'CNOT', 'qubits': [2, 4]})
+    assert set(response.json()['state']['vector']) == {'00000', '00101'}
+
+    trials = client.post('/api/trials', json={'session_id': session_id, 'qubit': 'ALL', 'n': 200}).json()
+    assert set(trials['counts']) <= {'00000', '00101'}
+
+    measured = client.post('/api/measure', json={'session_id': session_id, 'qubit': 'Q5'}).json()
+    assert measured['state']['collapsed']['Q5'] is True
+
+    bad = client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'CNOT', 'qubits': [1, 7]})
+    assert bad.status_code == 400
+
+
+def test_gates_accept_qubit_labels(client):
+    labelled = client.post('/api/session/new', json={'num_qubits': 5}).json()['session_id']
+    indexed = client.post('/api/session/new', json={'num_qubits': 5}).json()['session_id']
+    for session_id, targets in ((labelled, ['Q3', 'Q5']), (indexed, [2, 4])):
+        client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'H', 'qubits': targets[:1]})
+        client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'CNOT', 'qubits': targets})
+    states = [client.get(f'/api/state/{session_id}').json()['state'] for session_id in (labelled, indexed)]
+    assert states[0]['vector'] == states[1]['vector']
+
+    run = client.post(
+        '/api/circuit/run',
+        json={'session_id': labelled, 'operations': [{'type': 'gate', 'gate': 'X', 'qubits': ['Q1']}]},
+    )
+    assert set(run.json()['state']['vector']) == {'10000', '10101'}
+
+    for qubits in (['Q0'], ['3'], ['Q6']):
+        response = client.post('/api/gate/apply', json={'session_id': labelled, 'gate': 'X', 'qubits': qubits})
+        assert response.status_code in (400, 422)
+
+
+def test_circuit_run_applies_sequence_in_one_request(client):
+    session_id = client.post('/api/session/new').json()['session_id']
+    operations = [{'type': 'gate', 'gate': 'H'}, {'type': 'gate', 'gate': 'CNOT'}] + [
+        {'type': 'gate', 'gate': 'X', 'qubits': [1]} for _ in range(100)
+    ]
+    response = client.post(
+        '/api/circuit/run',
+        json={'session_id': session_id, 'operations': operations, 'trials': 400, 'trials_scope': 'BOTH'},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data['outcomes'] == []
+    assert set(data['trials']['counts']) <= {'00', '11'}
+
+    measured = client.post(
+        '/api/circuit/run',
+        json={'session_id': session_id, 'operations': [{'type': 'measure', 'qubit': 'BOTH'}]},
+    ).json()
+    outcome = measured['outcomes'][0]
+    assert outcome['Q1'] == outcome['Q2']
+    assert measured['state']['collapsed'] == {'Q1': True, 'Q2': True}
+
+    invalid = client.post(
+        '/api/circuit/run', json={'session_id': session_id, 'operations': [{'type': 'reset', 'qubit': 'ALL'}]}
+    )
+    assert invalid.status_code == 422
+
+
+def test_exact_trials_mode(client):
+    session_id = client.post('/api/session/new').json()['session_id']
+    client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'H'})
+    response = client.post(
+        '/api/trials',
+        json={'session_id': session_id, 'qubit': 'Q1', 'n': 10**9, 'mode': 'exact', 'sample': True},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data['probabilities'] == {'0': pytest.approx(0.5), '1': pytest.approx(0.5)}
+    assert sum(data['counts'].values()) == 10**9
+    assert set(data['intervals']) == {'0', '1'}
+
+
+def test_websocket_streams_state_diffs(client):
+    session_id = client.post('/api/session/new').json()['session_id']
+    with client.websocket_connect(f'/ws/session/{session_id}') as socket:
+        snapshot = socket.receive_json()
+        assert snapshot['type'] == 'state'
+        assert snapshot['state']['vector']['00'] == {'real': 1.0, 'imag': 0.0}
+
+        socket.send_json({'id': 'g1', 'type': 'gate', 'gate': 'X'})
+        diff = socket.receive_json()
+        assert diff['type'] == 'diff' and diff['id'] == 'g1' and diff['seq'] == 1
+        assert set(diff['vector']) == {'00', '10'}
+        assert 'collapsed' not in diff
+
+        socket.send_json({'type': 'measure', 'qubit': 'Q1'})
+        diff = socket.receive_json()
+        assert diff['outcome']['Q1'] == 1
+        assert diff['collapsed'] == {'Q1': True}
+        assert diff['vector'] == {}
+
+        socket.send_json({'type': 'gate'})
+        assert socket.receive_json()['type'] == 'error'
+
+    state = client.get(f'/api/state/{session_id}').json()['state']
+    assert state['last_measurement']['Q1'] == 1
+
+
+def test_websocket_sends_full_state_when_diff_is_too_large(client):
+    session_id = client.post('/api/session/new', json={'num_qubits': 11}).json()['session_id']
+    with client.websocket_connect(f'/ws/session/{session_id}') as socket:
+        socket.receive_json()
+        for qubit in range(10):
+            socket.send_json({'type': 'gate', 'gate': 'H', 'qubits': [qubit]})
+            diff = socket.receive_json()
+            assert diff['type'] == 'diff' and len(diff['vector']) == 2 ** (qubit + 1)
+        # The last H layer changes all 2048 amplitudes, more than a diff may carry.
+        socket.send_json({'id': 'wide', 'type': 'gate', 'gate': 'H', 'qubits': [10]})
+        message = socket.receive_json()
+        assert message['type'] == 'state' and message['id'] == 'wide' and message['seq'] == 11
+        assert message['state']['vector'] == client.get(f'/api/state/{session_id}').json()['state']['vector']
+
+
+def test_trials_stream_emits_progress_then_result(client):
+    session_id = client.post('/api/session/new').json()['session_id']
+    client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'H'})
+    payload = {'session_id': session_id, 'qubit': 'Q1', 'n': 1000, 'every': 300}
+    with client.stream('POST', '/api/trials/stream', json=payload) as response:
+        assert response.status_code == 200
+        events = [json.loads(line) for line in response.iter_lines() if line]
+    assert [event['done'] for event in events] == [300, 600, 900, 1000]
+    assert [event['type'] for event in events] == ['progress'] * 3 + ['result']
+    assert sum(events[-1]['counts'].values()) == 1000
+
+    payload['format'] = 'sse'
+    with client.stream('POST', '/api/trials/stream', json=payload) as response:
+        assert response.headers['content-type'].startswith('text/event-stream')
+        body = response.read().decode()
+    assert body.count('event: progress') == 3 and body.count('event: result') == 1
+
+    bad = client.post('/api/trials/stream', json={**payload, 'qubit': 'Q9'})
+    assert bad.status_code == 400
+
+
+def test_heavy_work_runs_in_compute_pool(client, monkeypatch):
+    from app import compute
+    from app.config import settings
+
+    monkeypatch.setattr(settings, 'compute_min_work', 1)
+    session_id = client.post('/api/session/new', json={'num_qubits': 3}).json()['session_id']
+    response = client.post('/api/circuit/run', json={
+        'session_id': session_id,
+        'operations': [{'type': 'gate', 'gate': 'X', 'qubits': [2]}, {'type': 'measure', 'qubit': 'Q3'}],
+        'trials': 50,
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body['outcomes'][0]['Q3'] == 1
+    assert body['trials']['counts'] == {'001': 50}
+
+    trials = client.post('/api/trials', json={'session_id': session_id, 'qubit': 'Q3', 'n': 20})
+    assert trials.json()['counts'] == {'1': 20}
+    assert client.get('/api/metrics').json()['compute']['completed'] >= 2
+
+    monkeypatch.setattr(compute._executor, 'max_pending', 0)
+    overloaded = client.post('/api/trials', json={'session_id': session_id, 'qubit': 'Q3', 'n': 20})
+    assert overloaded.status_code == 503
+
+
+def _crash(*args):
+    os._exit(1)
+
+
+def test_crashed_compute_worker_is_replaced(client, monkeypatch):
+    from app import compute
+    from app.config import settings
+
+    monkeypatch.setattr(settings, 'compute_min_work', 1)
+    session_id = client.post('/api/session/new').json()['session_id']
+    request = {'session_id': session_id, 'qubit': 'ALL', 'n': 20}
+    with monkeypatch.context() as patch:
+        patch.setattr(compute, '_trials_task', _crash)
+        assert client.post('/api/trials', json=request).status_code == 503
+    metrics = client.get('/api/metrics').json()['compute']
+    assert metrics['pending'] == 0 and metrics['restarts'] >= 1
+    assert client.post('/api/trials', json=request).json()['counts'] == {'00': 20}
+
+
+def _wait_for_job(client, job_id):
+    for _ in range(500):
+        job = client.get(f'/api/jobs/{job_id}').json()
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+
+def test_jobs_run_trials_and_circuits_in_background(client):
+    session_id = client.post('/api/session/new').json()['session_id']
+    submitted = client.post('/api/jobs', json={
+        'session_id': session_id,
+        'kind': 'circuit',
+        'operations': [{'type': 'gate', 'gate': 'X'}, {'type': 'gate', 'gate': 'CNOT'}],
+        'trials': 10,
+    })
+    assert submitted.status_code == 202
+    job = _wait_for_job(client, submitted.json()['job_id'])
+    assert job['status'] == 'succeeded' and job['progress'] == 1.0
+    result = client.get(f"/api/jobs/{job['job_id']}/result").json()['result']
+    assert result['trials']['counts'] == {'11': 10}
+    assert client.get(f'/api/state/{session_id}').json()['state']['vector']['11']['real'] == pytest.approx(1.0)
+
+    payload = {'session_id': session_id, 'kind': 'trials', 'qubit': 'Q2', 'n': 500}
+    job_id = client.post('/api/jobs', json=payload).json()['job_id']
+    _wait_for_job(client, job_id)
+    assert client.get(f'/api/jobs/{job_id}/result').json()['result']['counts'] == {'1': 500}
+
+    assert client.post('/api/jobs', json={'session_id': session_id, 'kind': 'trials'}).status_code == 422
+    assert client.get('/api/jobs/missing').status_code == 404
+
+
+def test_cancelled_job_reports_cancelled(client, monkeypatch):
+    from app import jobs
+
+    session_id = client.post('/api/session/new').json()['session_id']
+    gate = Event()
+
+    def blocked(session_id, params, progress, work):
+        gate.wait(5)
+        progress(0.5)
+        return {}
+
+    monkeypatch.setitem(jobs._HANDLERS, 'trials', blocked)
+    job_id = client.post('/api/jobs', json={'session_id': session_id, 'kind': 'trials', 'n': 10}).json()['job_id']
+    assert client.get(f'/api/jobs/{job_id}/result').status_code == 409
+    client.post(f'/api/jobs/{job_id}/cancel')
+    gate.set()
+    assert _wait_for_job(client, job_id)['status'] == 'cancelled'
+
+
+def test_cancel_after_last_progress_check_wins(client, monkeypatch):
+    from app import db, jobs, quantum
+
+    session_id = client.post('/api/session/new').json()['session_id']
+    finished, resume = Event(), Event()
+
+    def late(session_id, params, progress, work):
+        progress(1.0)
+        vector, state = db.fetch_session(session_id)
+        flipped = quantum.apply_gate_to_state(vector, 'X')
+        work.update_session(session_id, flipped, state.collapsed, state.last_measurement, state.version)
+        finished.set()
+        resume.wait(5)
+        return {'flipped': True}
+
+    monkeypatch.setitem(jobs._HANDLERS, 'trials', late)
+    job_id = client.post('/api/jobs', json={'session_id': session_id, 'kind': 'trials', 'n': 10}).json()['job_id']
+    assert finished.wait(5)
+    assert client.post(f'/api/jobs/{job_id}/cancel').json()['status'] == 'cancelled'
+    resume.set()
+    job = _wait_for_job(client, job_id)
+    assert job['status'] == 'cancelled'
+    assert client.get(f'/api/jobs/{job_id}/result').json()['result'] is None
+    state = client.get(f'/api/state/{session_id}').json()['state']
+    assert state['vector']['00']['real'] == pytest.approx(1.0) and state['version'] == 0
+
+
+def test_history_pages_with_cursor_and_filters(client):
+    session_id = client.post('/api/session/new').json()['session_id']
+    for gate in ('X', 'H', 'X'):
+        client.post('/api/gate/apply', json={'session_id': session_id, 'gate': gate})
+    client.post('/api/measure', json={'session_id': session_id, 'qubit': 'Q1'})
+    for n in (10, 20):
+        client.post('/api/trials', json={'session_id': session_id, 'qubit': 'Q2', 'n': n})
+
+    first = client.get(f'/api/session/{session_id}/history', params={'limit': 3}).json()
+    assert [item['action_type'] for item in first['items']] == ['MEASURE', 'GATE', 'GATE']
+    second = client.get(
+        f'/api/session/{session_id}/history', params={'limit': 3, 'cursor': first['next_cursor']}
+    ).json()
+    assert [item['action_type'] for item in second['items']] == ['GATE', 'SESSION_CREATE']
+    assert second['next_cursor'] is None
+
+    gates = client.get(f'/api/session/{session_id}/history', params={'type': 'GATE'}).json()['items']
+    assert [item['payload']['gate'] for item in gates] == ['X', 'H', 'X']
+
+    trials = client.get(f'/api/session/{session_id}/trials', params={'scope': 'Q2'}).json()
+    assert [item['n'] for item in trials['items']] == [20, 10]
+    assert client.get('/api/session/missing/history').status_code == 404
+
+
+@pytest.mark.parametrize('mode', ['full', 'events'])
+def test_replay_rebuilds_state_at_any_action(client, monkeypatch, mode):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, 'action_log_mode', mode)
+    monkeypatch.setattr(settings, 'snapshot_interval', 3)
+    session_id = client.post('/api/session/new', json={'num_qubits': 3}).json()['session_id']
+    states = []
+    steps = [
+        ('/api/gate/apply', {'gate': 'H'}),
+        ('/api/gate/apply', {'gate': 'CNOT'}),
+        ('/api/measure', {'qubit': 'Q2'}),
+        ('/api/gate/apply', {'gate': 'X', 'qubits': [2]}),
+        ('/api/circuit/run', {'operations': [
+            {'type': 'gate', 'gate': 'H', 'qubits': [2]},
+            {'type': 'measure', 'qubit': 'ALL'},
+        ]}),
+        ('/api/reset', {'qubit': 'Q1'}),
+    ]
+    for path, body in steps:
+        response = client.post(path, json={'session_id': session_id, **body}).json()
+        states.append(response['state'])
+
+    history = client.get(f'/api/session/{session_id}/history').json()['items'][::-1]
+    assert ('state' in history[1]['payload']) is (mode == 'full')
+    for action, expected in zip(history[1:], states):
+        replayed = client.get(f'/api/session/{session_id}/replay', params={'action_id': action['id']}).json()
+        for basis, amplitude in expected['vector'].items():
+            assert replayed['state']['vector'][basis]['real'] == pytest.approx(amplitude['real'], abs=1e-9)
+        assert replayed['state']['collapsed'] == expected['collapsed']
+        assert replayed['state']['last_measurement'] == expected['last_measurement']
+
+    latest = client.get(f'/api/session/{session_id}/replay').json()
+    assert latest['action_id'] == history[-1]['id']
+    if mode == 'events':
+        assert latest['snapshot_action_id'] is not None and latest['events_replayed'] < len(history)
+
+
+def test_replay_refuses_snapshots_whose_history_was_pruned(client, monkeypatch):
+    from app import db
+    from app.config import settings
+
+    monkeypatch.setattr(settings, 'action_log_mode', 'events')
+    monkeypatch.setattr(settings, 'snapshot_interval', 3)
+    session_id = client.post('/api/session/new').json()['session_id']
+    for _ in range(5):
+        client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'X'})
+    history = client.get(f'/api/session/{session_id}/history').json()['items'][::-1]
+    assert client.get(f'/api/session/{session_id}/replay').json()['snapshot_action_id'] == history[3]['id']
+
+    # Age out everything up to the fourth gate, including the snapshot taken at the third.
+    with db.get_connection() as conn:
+        conn.execute(
+            "UPDATE actions SET created_at = '2000-01-01T00:00:00+00:00' WHERE session_id = ? AND id <= ?",
+            (session_id, history[4]['id']),
+        )
+    assert db.delete_history('actions', 100, before='2001-01-01T00:00:00+00:00') >= 5
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM snapshots WHERE session_id = ?", (session_id,)).fetchone()[0] == 0
+    assert client.get(f'/api/session/{session_id}/replay').status_code == 409
+
+
+def test_bulk_state_and_gate_application(client):
+    two = [client.post('/api/session/new').json()['session_id'] for _ in range(3)]
+    three = client.post('/api/session/new', json={'num_qubits': 3}).json()['session_id']
+
+    response = client.post('/api/sessions/gate/apply', json={'items': [
+        {'session_id': two[0], 'gate': 'X'},
+        {'session_id': two[1], 'gate': 'X'},
+        {'session_id': two[2], 'gate': 'H', 'qubits': [1]},
+        {'session_id': three, 'gate': 'X', 'qubits': [2]},
+    ]})
+    assert response.status_code == 200
+    states = response.json()['states']
+    assert states[two[0]]['vector']['10']['real'] == pytest.approx(1.0)
+    assert states[two[2]]['vector']['01']['real'] == pytest.approx(2 ** -0.5)
+    assert states[three]['vector'] == {'001': {'real': 1.0, 'imag': 0.0}}
+
+    read = client.post('/api/sessions/state', json={'session_ids': [two[1], three, 'missing']}).json()
+    assert read['missing'] == ['missing']
+    assert read['states'][two[1]] == client.get(f'/api/state/{two[1]}').json()['state']
+
+    duplicate = {'items': [{'session_id': two[0], 'gate': 'X'}, {'session_id': two[0], 'gate': 'H'}]}
+    assert client.post('/api/sessions/gate/apply', json=duplicate).status_code == 422
+    unknown = {'items': [{'session_id': 'missing', 'gate': 'X'}]}
+    assert client.post('/api/sessions/gate/apply', json=unknown).status_code == 404
+
+
+def test_parametric_gates_and_sweep(client):
+    session_id = client.post('/api/session/new').json()['session_id']
+    response = client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'RX', 'theta': math.pi})
+    assert response.status_code == 200
+    assert response.json()['state']['vector']['10']['imag'] == pytest.approx(-1.0)
+    assert client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'RY'}).status_code == 422
+    assert client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'X', 'theta': 1}).status_code == 422
+
+    response = client.post('/api/sweep', json={
+        'session_id': session_id,
+        'operations': [{'gate': 'RX', 'qubits': [0], 'param': 'theta'}],
+        'parameters': {'theta': [0, math.pi]},
+        'scope': 'Q1',
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body['points'] == [[0.0], [math.pi]]
+    assert body['probabilities'] == [pytest.approx([0.0, 1.0]), pytest.approx([1.0, 0.0])]
+
+    unknown = {'operations': [{'gate': 'RZ', 'param': 'phi'}], 'parameters': {'theta': [0]}}
+    assert client.post('/api/sweep', json=unknown).status_code == 422
+    huge = {'num_qubits': 20, 'operations': [], 'parameters': {'theta': list(range(100))}}
+    assert client.post('/api/sweep', json=huge).status_code == 400
+    grid = {'operations': [], 'parameters': {name: list(range(1000)) for name in 'abc'}}
+    assert client.post('/api/sweep', json=grid).status_code == 400
+    long = {'operations': [], 'parameters': {'theta': [0.0] * 10001}}
+    assert client.post('/api/sweep', json=long).status_code == 422
+
+
+def test_non_finite_angles_are_rejected(client):
+    session_id = client.post('/api/session/new').json()['session_id']
+    for theta in (math.nan, math.inf, -math.inf):
+        gate = {'session_id': session_id, 'gate': 'RX', 'theta': theta}
+        assert client.post('/api/gate/apply', json=gate).status_code == 422
+        operation = {'type': 'gate', 'gate': 'RY', 'theta': theta}
+        run = {'session_id': session_id, 'operations': [operation]}
+        assert client.post('/api/circuit/run', json=run).status_code == 422
+        bulk = {'items': [{'session_id': session_id, 'gate': 'P', 'theta': theta}]}
+        assert client.post('/api/sessions/gate/apply', json=bulk).status_code == 422
+        fixed = {'operations': [{'gate': 'RZ', 'theta': theta}], 'parameters': {'phi': [0.0]}}
+        assert client.post('/api/sweep', json=fixed).status_code == 422
+        swept = {'operations': [{'gate': 'RZ', 'param': 'phi'}], 'parameters': {'phi': [0.0, theta]}}
+        assert client.post('/api/sweep', json=swept).status_code == 422
+    state = client.get(f'/api/state/{session_id}')
+    assert state.status_code == 200
+    assert state.json()['state']['vector']['00']['real'] == pytest.approx(1.0)
+
+
+def test_observables_on_bell_state(client):
+    session_id = client.post('/api/session/new').json()['session_id']
+    client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'H'})
+    client.post('/api/gate/apply', json={'session_id': session_id, 'gate': 'CNOT'})
+    response = client.post('/api/observables', json={'session_id': session_id, 'observables': ['ZZ', 'XX', 'YY', 'Z1']})
+    assert response.status_code == 200
+    expectations = response.json()['expectations']
+    assert expectations == {
+        'ZZ': pytest.approx(1.0), 'XX': pytest.approx(1.0), 'YY': pytest.approx(-1.0), 'Z1': pytest.approx(0.0)
+    }
+    assert client.post('/api/observables', json={'session_id': session_id, 'observables': ['ZZZ']}).status_code == 400
+    assert client.post('/api/observables', json={'session_id': 'missing', 'observables': ['Z1']}).status_code == 404
+
+
+def test_noise_model_shapes_trials(client, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, 'compute_min_work', 1)
+    session_id = client.post('/api/session/new').json()['session_id']
+    response = client.post('/api/circuit/run', json={
+        'session_id': session_id,
+        'operations': [{'type': 'gate', 'gate': 'X'}],
+        'trials': 40,
+        'noise': {'amplitude_damping': 1.0},
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body['trials']['counts'] == {'00': 40}
+    assert body['state']['vector']['10']['real'] == pytest.approx(1.0)
+
+    readout = {'session_id': session_id, 'qubit': 'ALL', 'n': 30, 'noise': {'readout_error': 1.0}}
+    assert client.post('/api/trials', json=readout).json()['counts'] == {'01': 30}
+    exact = client.post('/api/trials', json={**readout, 'mode': 'exact'}).json()
+    assert exact['probabilities'] == {'01': pytest.approx(1.0)}
+
+    monkeypatch.setattr(settings, 'noise_readout_error', 1.0)
+    assert client.post('/api/trials', json={**readout, 'noise': None}).json()['counts'] == {'01': 30}
+    assert client.post('/api/trials', json={**readout, 'noise': {'depolarizing': 2}}).status_code == 422
@@ -0,0 +1,363 @@
+import json
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app import db, quantum
+from app.cache import CachedSession, SessionCache
+from app.config import settings
+from app.utils import serialize_state
+
+
+@pytest.fixture(autouse=True)
+def database():
+    db.init_db()
+    yield
+    db.flush_cache()
+
+
+def _stored_vector(session_id):
+    with db.get_connection() as conn:
+        row = conn.execute("SELECT vector FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    return db.decode_state(row['vector'])
+
+
+def test_pooled_connections_close_with_their_threads():
+    before = len(db._pool)
+    opened = []
+
+    def work():
+        conn = db.get_connection()
+        conn.execute("SELECT 1")
+        opened.append(conn)
+
+    for _ in range(50):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    assert len(db._pool) <= before
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute("SELECT 1")
+
+
+def test_cached_session_reads_only_revalidate_the_version(monkeypatch):
+    session_id = db.create_session().session_id
+    connection = db.get_connection()
+    statements = []
+
+    class Recorder:
+        def execute(self, sql, *args):
+            statements.append(sql)
+            return connection.execute(sql, *args)
+
+    monkeypatch.setattr(db, 'get_connection', Recorder)
+    vector, state = db.fetch_session(session_id)
+    assert np.allclose(vector, quantum.initial_state())
+    assert state.collapsed == {'Q1': False, 'Q2': False}
+    assert statements == [db._VERSION_SQL]
+
+    def fail():
+        raise AssertionError('read path touched the database')
+
+    monkeypatch.setattr(settings, 'session_cache_mode', 'write-back')
+    monkeypatch.setattr(db, 'get_connection', fail)
+    assert db.fetch_session(session_id)[1].version == state.version
+
+
+def test_cached_reads_see_other_workers_writes():
+    session_id = db.create_session().session_id
+    db.fetch_session(session_id)
+    flipped = quantum.apply_gate_to_state(quantum.initial_state(), 'X')
+    # Another worker process commits a new state behind this process's cache.
+    with db.get_connection() as conn:
+        conn.execute(
+            "UPDATE sessions SET vector = ?, version = version + 1 WHERE id = ?",
+            (db.encode_state(flipped), session_id),
+        )
+    vector, state = db.fetch_session(session_id)
+    assert state.version == 1 and np.allclose(vector, flipped)
+    assert db.fetch_sessions([session_id])[session_id][1].version == 1
+    with db.get_connection() as conn:
+        conn.execute("UPDATE sessions SET version = version + 1 WHERE id = ?", (session_id,))
+    assert db.fetch_sessions([session_id])[session_id][1].version == 2
+
+
+def test_write_back_defers_until_flush(monkeypatch):
+    monkeypatch.setattr(settings, 'session_cache_mode', 'write-back')
+    session_id = db.create_session().session_id
+    new_vector = quantum.apply_gate_to_state(quantum.initial_state(), 'X')
+    db.update_session_state(session_id, new_vector, {'Q1': False, 'Q2': False}, {'Q1': None, 'Q2': None})
+
+    assert np.allclose(_stored_vector(session_id), quantum.initial_state())
+    vector, _ = db.fetch_session(session_id)
+    assert np.allclose(vector, new_vector)
+
+    assert db.flush_cache() >= 1
+    assert np.allclose(_stored_vector(session_id), new_vector)
+
+
+def test_session_cache_is_bounded_by_vector_bytes():
+    written = []
+    cache = SessionCache(capacity=100, ttl=60.0, writer=written.extend, max_bytes=4096)
+
+    def entry(qubits, dirty=False):
+        return CachedSession(quantum.initial_state(qubits), {}, {}, 'now', dirty=dirty)
+
+    for index in range(4):
+        cache.put(f'small-{index}', entry(4))
+    assert len(cache) == 4 and cache.nbytes == 4 * 256
+    cache.put('wide', entry(8))
+    assert 'wide' in cache and 'small-0' not in cache and cache.nbytes <= 4096
+    cache.put('huge', entry(9, dirty=True))
+    assert 'huge' not in cache and [session_id for session_id, _ in written] == ['huge']
+    cache.discard('wide')
+    assert cache.nbytes == sum(item.vector.nbytes for item in cache._entries.values())
+
+
+def test_transaction_commits_state_and_log_together(monkeypatch):
+    session_id = db.create_session().session_id
+    new_vector = quantum.apply_gate_to_state(quantum.initial_state(), 'X')
+    with db.transaction() as work:
+        work.update_session(session_id, new_vector, {'Q1': False, 'Q2': False}, {'Q1': None, 'Q2': None})
+        work.log_action(session_id, 'GATE', {'gate': 'X'})
+        assert np.allclose(_stored_vector(session_id), quantum.initial_state())
+    assert np.allclose(_stored_vector(session_id), new_vector)
+    assert db.flush_audit_log(timeout=5)
+    with db.get_connection() as conn:
+        actions = conn.execute(
+            "SELECT action_type FROM actions WHERE session_id = ? ORDER BY id", (session_id,)
+        ).fetchall()
+    assert [row['action_type'] for row in actions] == ['SESSION_CREATE', 'GATE']
+
+
+def test_transaction_discards_staged_work_on_error():
+    session_id = db.create_session().session_id
+    new_vector = quantum.apply_gate_to_state(quantum.initial_state(), 'X')
+    with pytest.raises(RuntimeError):
+        with db.transaction() as work:
+            work.update_session(session_id, new_vector, {'Q1': False, 'Q2': False}, {'Q1': None, 'Q2': None})
+            raise RuntimeError('route failed')
+    vector, _ = db.fetch_session(session_id)
+    assert np.allclose(vector, quantum.initial_state())
+
+
+def test_async_audit_log_batches_rows(monkeypatch):
+    monkeypatch.setattr(settings, 'audit_mode', 'async')
+    session_id = db.create_session().session_id
+    state = quantum.initial_state()
+    for _ in range(20):
+        db.log_action(session_id, 'GATE', {'gate': 'H', 'state': state})
+    db.log_trials(session_id, 'BOTH', 10, {'00': 10}, {'00': 1.0})
+    assert db.flush_audit_log(timeout=5)
+
+    with db.get_connection() as conn:
+        gates = conn.execute(
+            "SELECT payload FROM actions WHERE session_id = ? AND action_type = 'GATE'", (session_id,)
+        ).fetchall()
+        trials = conn.execute("SELECT counts FROM trials WHERE session_id = ?", (session_id,)).fetchall()
+    assert len(gates) == 20
+    assert json.loads(gates[0]['payload'])['state']['00'] == {'real': 1.0, 'imag': 0.0}
+    assert [json.loads(row['counts']) for row in trials] == [{'00': 10}]
+    metrics = db.audit_log_metrics()
+    assert metrics['queue_depth'] == 0
+    assert metrics['rows_written'] >= 21
+
+
+def test_audit_log_retries_busy_batches_and_isolates_bad_rows(monkeypatch):
+    import sqlite3
+
+    monkeypatch.setattr(settings, 'audit_mode', 'async')
+    writer = db._audit_log
+    write_rows = writer._writer
+    busy = [2]
+
+    def flaky(actions, trials):
+        if busy[0]:
+            busy[0] -= 1
+            raise sqlite3.OperationalError('database is locked')
+        write_rows(actions, trials)
+
+    monkeypatch.setattr(writer, '_writer', flaky)
+    monkeypatch.setattr(writer, 'retry_backoff', 0.001)
+    before = writer.metrics()
+    session_id = db.create_session().session_id
+    for index in range(5):
+        db.log_action(session_id, 'GATE', {'gate': 'X', 'index': index})
+    db.log_action(session_id, 'GATE', {'gate': 'X', 'unencodable': object()})
+    assert db.flush_audit_log(timeout=5)
+
+    with db.get_connection() as conn:
+        gates = conn.execute(
+            "SELECT payload FROM actions WHERE session_id = ? AND action_type = 'GATE'", (session_id,)
+        ).fetchall()
+    assert sorted(json.loads(row['payload'])['index'] for row in gates) == list(range(5))
+    metrics = writer.metrics()
+    assert metrics['retries'] - before['retries'] == 2
+    assert metrics['rows_dropped'] - before['rows_dropped'] == 1
+
+
+def test_legacy_json_vectors_are_migrated_to_binary():
+    session_id = db.create_session().session_id
+    x_state = quantum.apply_gate_to_state(quantum.initial_state(), 'X')
+    with db.get_connection() as conn:
+        conn.execute(
+            "UPDATE sessions SET vector = ? WHERE id = ?", (serialize_state(x_state), session_id)
+        )
+        conn.execute("PRAGMA user_version = 0")
+    db.flush_cache()
+    db._cache.discard(session_id)
+
+    vector, _ = db.fetch_session(session_id)
+    assert np.allclose(vector, x_state)
+
+    db.init_db()
+    with db.get_connection() as conn:
+        row = conn.execute(
+            "SELECT typeof(vector) AS kind, length(vector) AS size FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+    assert (row['kind'], row['size']) == ('blob', 64)
+    assert np.allclose(_stored_vector(session_id), x_state)
+
+
+def test_stale_session_writes_are_rejected():
+    session_id = db.create_session().session_id
+    vector, state = db.fetch_session(session_id)
+    flipped = quantum.apply_gate_to_state(vector, 'X')
+    with db.transaction() as work:
+        model = work.update_session(session_id, flipped, state.collapsed, state.last_measurement, state.version)
+    assert model.version == 1
+    with pytest.raises(db.SessionConflict):
+        with db.transaction() as work:
+            work.update_session(session_id, flipped, state.collapsed, state.last_measurement, state.version)
+
+    # Another worker process bumps the row after this request read it.
+    vector, state = db.fetch_session(session_id)
+    with db.get_connection() as conn:
+        conn.execute("UPDATE sessions SET version = version + 1 WHERE id = ?", (session_id,))
+    with pytest.raises(db.SessionConflict):
+        with db.transaction() as work:
+            work.update_session(session_id, vector, state.collapsed, state.last_measurement, state.version)
+    assert db.fetch_session(session_id)[1].version == 2
+
+
+def test_restart_only_interrupts_jobs_of_exited_workers():
+    session_id = db.create_session().session_id
+    mine = db.create_job(session_id, 'trials', {'qubit': 'ALL', 'n': 1})
+    assert mine['owner'] == db.WORKER_ID
+    sibling = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        running = db.create_job(session_id, 'trials', {'qubit': 'ALL', 'n': 1})
+        db.update_job(running['id'], status='running')
+        queued = db.create_job(session_id, 'trials', {'qubit': 'ALL', 'n': 1})
+        with db.get_connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET owner = ? WHERE id = ?", (f'{socket.gethostname()}:{sibling.pid}', running['id'])
+            )
+            conn.execute("UPDATE jobs SET owner = NULL WHERE id = ?", (queued['id'],))
+
+        # Jobs owned by this process are left over from a previous one with the same pid.
+        assert db.interrupt_jobs() >= 1
+        assert db.fetch_job(mine['id'])['status'] == 'failed'
+        assert db.fetch_job(running['id'])['status'] == 'running'
+        assert db.fetch_job(queued['id'])['status'] == 'queued'
+    finally:
+        sibling.kill()
+        sibling.wait()
+    assert db.interrupt_jobs() >= 1
+    assert db.fetch_job(running['id'])['status'] == 'failed'
+    db.update_job(queued['id'], status='cancelled')
+
+
+def test_concurrent_writers_never_lose_updates():
+    session_id = db.create_session().session_id
+
+    def flip():
+        while True:
+            vector, state = db.fetch_session(session_id)
+            try:
+                with db.transaction() as work:
+                    work.update_session(
+                        session_id,
+                        quantum.apply_gate_to_state(vector, 'X'),
+                        state.collapsed,
+                        state.last_measurement,
+                        state.version,
+                    )
+                return
+            except db.SessionConflict:
+                continue
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for _ in range(41):
+            pool.submit(flip)
+    vector, state = db.fetch_session(session_id)
+    assert state.version == 41
+    assert np.allclose(vector, quantum.apply_gate_to_state(quantum.initial_state(), 'X'))
+
+
+def test_retention_expires_idle_sessions_and_archives_history(tmp_path):
+    import gzip
+
+    from app.retention import RetentionSweeper
+
+    stale = db.create_session().session_id
+    live = db.create_session().session_id
+    db.log_trials(stale, 'Q1', 5, {'0': 5}, {'0': 1.0})
+    db.flush_audit_log()
+    db.flush_cache()
+    db._cache.clear()
+    with db.get_connection() as conn:
+        conn.execute("UPDATE sessions SET updated_at = '2000-01-01T00:00:00+00:00' WHERE id = ?", (stale,))
+
+    sweeper = RetentionSweeper(session_ttl=3600, history_ttl=0, batch_size=1, vacuum_pages=10, archive_dir=tmp_path)
+    removed = sweeper.sweep()
+    assert removed['sessions'] == 1 and removed['actions'] == 1 and removed['trials'] == 1
+    with pytest.raises(KeyError):
+        db.fetch_session(stale)
+    assert db.session_exists(live)
+
+    archived = {}
+    for path in tmp_path.iterdir():
+        with gzip.open(path, 'rt') as handle:
+            archived[path.name.split('-')[0]] = [json.loads(line) for line in handle]
+    assert archived['actions'][0]['action_type'] == 'SESSION_CREATE'
+    assert archived['trials'][0]['session_id'] == stale
+
+
+def test_retention_expires_sessions_left_in_the_cache(monkeypatch):
+    from app.retention import RetentionSweeper
+
+    idle = db.create_session().session_id
+    db.fetch_session(idle)
+    with db.get_connection() as conn:
+        conn.execute("UPDATE sessions SET updated_at = '2000-01-01T00:00:00+00:00' WHERE id = ?", (idle,))
+    sweeper = RetentionSweeper(session_ttl=3600, history_ttl=0, batch_size=10, vacuum_pages=0)
+
+    # Still within the cache TTL: recently used, so kept.
+    sweeper.sweep()
+    assert idle in db._cache and db.session_exists(idle)
+
+    monkeypatch.setattr(db._cache, 'ttl', 0.0)
+    sweeper.sweep()
+    assert idle not in db._cache and not db.session_exists(idle)
+
+
+def test_sweeper_converts_to_incremental_vacuum_only_when_asked(monkeypatch):
+    from app.retention import RetentionSweeper
+
+    converted = []
+    monkeypatch.setattr(db, 'incremental_vacuum_enabled', lambda: False)
+    monkeypatch.setattr(db, 'enable_incremental_vacuum', lambda: converted.append(True) or True)
+    for convert in (False, True):
+        sweeper = RetentionSweeper(
+            session_ttl=0, history_ttl=0, batch_size=1, vacuum_pages=10, convert_vacuum=convert
+        )
+        sweeper.start(3600)
+        sweeper.stop()
+    assert converted == [True]
@@ -1,9 +1,11 @@
 import math
 
 import numpy as np
+import pytest
 
-from app import quantum
-from app.utils import probabilities_from_amplitudes
+from app import compiler, noise, observables, quantum, rng, sweep
+from app.models import CircuitOperation, SweepOperation
+from app.utils import normalize, normalize_batch, probabilities_from_amplitudes
 
 
 def test_h_gate_probability_balanced():
@@ -44,3 +46,286 @@ def test_resets_clear_entanglement():
     assert reset_state[3] == 0
     norm = np.linalg.norm(reset_state)
     assert math.isclose(norm, 1.0, rel_tol=1e-9)
+
+
+def test_run_trials_marginalizes_single_qubit_scope():
+    state = quantum.initial_state()
+    state = quantum.apply_gate_to_state(state, 'X')
+    counts, freqs = quantum.run_trials(state, 'Q1', 1000)
+    assert counts == {'1': 1000}
+    assert freqs == {'1': 1.0}
+    counts, _ = quantum.run_trials(state, 'Q2', 1000)
+    assert counts == {'0': 1000}
+
+
+def test_run_trials_large_n_matches_distribution():
+    state = quantum.initial_state()
+    state = quantum.apply_gate_to_state(state, 'H')
+    state = quantum.apply_gate_to_state(state, 'CNOT')
+    counts, freqs = quantum.run_trials(state, 'BOTH', 200_000)
+    assert set(counts) == {'00', '11'}
+    assert sum(counts.values()) == 200_000
+    assert math.isclose(freqs['00'], 0.5, abs_tol=0.01)
+
+
+def test_seeded_rng_reproduces_trials():
+    state = quantum.apply_gate_to_state(quantum.initial_state(), 'H')
+    first = quantum.run_trials(state, 'Q1', 10_000, rng.create_rng('philox', seed=7))
+    second = quantum.run_trials(state, 'Q1', 10_000, rng.create_rng('philox', seed=7))
+    assert first == second
+
+
+def test_secure_rng_draws_batches():
+    generator = rng.create_rng('secure')
+    values = generator.random(1000)
+    assert values.shape == (1000,)
+    assert ((values >= 0) & (values < 1)).all()
+    assert 0 <= generator.random() < 1
+
+
+def _embedded(matrix, qubits, count):
+    # Reference full-space operator built by brute force over basis states.
+    size = 1 << count
+    full = np.zeros((size, size), dtype=np.complex128)
+    arity = len(qubits)
+    for column in range(size):
+        bits = [(column >> (count - 1 - q)) & 1 for q in range(count)]
+        local = int(''.join(str(bits[q]) for q in qubits), 2)
+        for row_local in range(1 << arity):
+            out_bits = list(bits)
+            for position, q in enumerate(qubits):
+                out_bits[q] = (row_local >> (arity - 1 - position)) & 1
+            row = int(''.join(map(str, out_bits)), 2)
+            full[row, column] += matrix[row_local, local]
+    return full
+
+
+def test_tensor_engine_matches_full_operator():
+    generator = np.random.default_rng(3)
+    count = 4
+    state = generator.normal(size=1 << count) + 1j * generator.normal(size=1 << count)
+    state /= np.linalg.norm(state)
+    for gate, qubits in [('H', [2]), ('X', [3]), ('CNOT', [3, 1]), ('CNOT', [0, 2])]:
+        expected = _embedded(quantum.GATE_MATRICES[gate], qubits, count) @ state
+        assert np.allclose(quantum.apply_gate_to_state(state, gate, qubits), expected)
+
+
+def test_ghz_state_on_many_qubits():
+    count = 12
+    state = quantum.apply_gate_to_state(quantum.initial_state(count), 'H', [0])
+    for target in range(1, count):
+        state = quantum.apply_gate_to_state(state, 'CNOT', [target - 1, target])
+    counts, _ = quantum.run_trials(state, 'ALL', 2000)
+    assert set(counts) <= {'0' * count, '1' * count}
+    outcome, collapsed = quantum.measure_all(state)
+    assert len(set(outcome.values())) == 1
+    result, _ = quantum.measure_qubit(collapsed, 'Q7')
+    assert result == outcome['Q1']
+
+
+def test_reset_targets_any_qubit():
+    state = quantum.apply_gate_to_state(quantum.initial_state(3), 'X', [2])
+    reset_state = quantum.reset_qubit(state, 'Q3')
+    assert np.allclose(reset_state, quantum.initial_state(3))
+
+
+def test_cancel_inverses_skips_commuting_gates():
+    gates = [('H', (0,)), ('X', (2,)), ('H', (0,)), ('CNOT', (0, 1)), ('X', (1,)), ('CNOT', (0, 1))]
+    assert compiler.cancel_inverses(gates) == [('X', (2,)), ('CNOT', (0, 1)), ('X', (1,)), ('CNOT', (0, 1))]
+
+
+def test_compiled_circuit_matches_gate_by_gate():
+    generator = np.random.default_rng(5)
+    names = [('H', 1), ('X', 1), ('CNOT', 2)]
+    gates = []
+    for _ in range(60):
+        name, arity = names[generator.integers(len(names))]
+        gates.append((name, tuple(int(q) for q in generator.choice(4, size=arity, replace=False))))
+    expected = quantum.initial_state(4)
+    for name, qubits in gates:
+        expected = quantum.apply_gate_to_state(expected, name, qubits)
+    assert np.allclose(compiler.run_gates(quantum.initial_state(4), gates), expected)
+
+
+def test_two_qubit_history_fuses_to_one_cached_unitary():
+    history = [('H', (0,)), ('CNOT', (0, 1)), ('X', (0,))] * 30
+    blocks = compiler.compile_gates(history)
+    assert len(blocks) == 1 and blocks[0].matrix.shape == (4, 4)
+    assert compiler.compile_gates(history) is blocks
+
+
+def test_exact_trials_report_distribution_and_intervals():
+    state = quantum.apply_gate_to_state(quantum.initial_state(), 'H')
+    result = quantum.exact_trials(state, 'BOTH', 1_000_000)
+    assert result['counts'] == {}
+    assert result['probabilities'] == pytest.approx({'00': 0.5, '10': 0.5})
+    low, high = result['intervals']['00']
+    assert low < 0.5 < high and high - low < 0.01
+
+    sampled = quantum.exact_trials(state, 'Q1', 10**12, sample=True, rng=rng.create_rng('secure'))
+    assert sum(sampled['counts'].values()) == 10**12
+    low, high = sampled['intervals']['1']
+    assert low <= sampled['freqs']['1'] <= high
+
+
+def test_measurement_reuses_preallocated_output():
+    state = quantum.apply_gate_to_state(quantum.initial_state(3), 'H', [1])
+    buffer = np.empty_like(state)
+    result, collapsed = quantum.measure_qubit(state, 'Q2', rng.create_rng('philox', seed=2), out=buffer)
+    assert collapsed is buffer
+    assert math.isclose(np.linalg.norm(collapsed), 1.0, rel_tol=1e-12)
+    assert collapsed[0b010 if result else 0] == pytest.approx(1)
+    assert np.allclose(state, quantum.apply_gate_to_state(quantum.initial_state(3), 'H', [1]))
+
+
+def test_wide_registers_skip_dense_projector_tables():
+    count = quantum.PROJECTOR_TABLE_QUBITS + 1
+    assert quantum.operator_table(count).projectors is None
+    state = quantum.apply_gate_to_state(quantum.initial_state(count), 'H', [0])
+    quantum.measure_qubit(state, 'Q1', rng.create_rng('philox', seed=1))
+    assert 1 << count not in getattr(quantum._scratch, 'buffers', {})
+    state = quantum.apply_gate_to_state(quantum.initial_state(count), 'X', [count - 1])
+    result, collapsed = quantum.measure_qubit(state, f'Q{count}')
+    assert result == 1
+    assert np.allclose(collapsed, state)
+
+
+def test_apply_matrix_accepts_stacked_states():
+    rng_ = np.random.default_rng(3)
+    states = rng_.normal(size=(4, 8)) + 1j * rng_.normal(size=(4, 8))
+    for matrix, qubits in ((quantum.H, (1,)), (quantum.CNOT, (2, 0))):
+        stacked = quantum.apply_matrix(states, matrix, qubits)
+        for row, state in zip(stacked, states):
+            assert np.allclose(row, quantum.apply_matrix(state, matrix, qubits))
+    normalized = quantum.apply_gate_batch(states, 'X', [0])
+    assert np.allclose(np.linalg.norm(normalized, axis=1), 1.0)
+
+
+def test_batch_kernels_match_single_state_kernels():
+    generator = np.random.default_rng(11)
+    states = generator.normal(size=(64, 8)) + 1j * generator.normal(size=(64, 8))
+    states /= np.linalg.norm(states, axis=1, keepdims=True)
+    states[0] = quantum.initial_state(3)
+
+    outcomes, collapsed = quantum.measure_qubit_batch(states, 'Q2', rng.create_rng('philox', seed=5))
+    single = rng.create_rng('philox', seed=5)
+    for state, outcome, row in zip(states, outcomes, collapsed):
+        expected_outcome, expected = quantum.measure_qubit(state, 'Q2', single)
+        assert outcome == expected_outcome
+        assert np.allclose(row, expected)
+
+    indices, collapsed = quantum.measure_all_batch(states, rng.create_rng('philox', seed=6))
+    single = rng.create_rng('philox', seed=6)
+    for state, index, row in zip(states, indices, collapsed):
+        outcome, expected = quantum.measure_all(state, single)
+        assert np.allclose(row, expected) and expected[index] == 1
+
+    reset = quantum.reset_qubit_batch(states, 'Q1')
+    for state, row in zip(states, reset):
+        assert np.allclose(row, quantum.reset_qubit(state, 'Q1'))
+    with pytest.raises(ValueError):
+        quantum.reset_qubit_batch(states[0], 'Q1')
+
+
+def test_batch_measurement_without_projector_tables():
+    count = quantum.PROJECTOR_TABLE_QUBITS + 1
+    states = np.stack([quantum.apply_gate_to_state(quantum.initial_state(count), 'H', [4])] * 16)
+    outcomes, collapsed = quantum.measure_qubit_batch(states, 'Q5', rng.create_rng('philox', seed=2))
+    assert 0 < outcomes.sum() < 16
+    assert np.allclose(np.abs(collapsed[np.arange(16), outcomes << (count - 5)]), 1.0)
+
+
+def test_parametric_gate_matrices():
+    assert np.allclose(quantum.gate_matrix('RX', math.pi), -1j * quantum.X)
+    assert np.allclose(quantum.gate_matrix('RY', math.pi / 2) @ [1, 0], [2 ** -0.5, 2 ** -0.5])
+    assert np.allclose(quantum.gate_matrix('RZ', math.pi / 2), np.diag(np.exp([-1j * math.pi / 4, 1j * math.pi / 4])))
+    assert np.allclose(quantum.gate_matrix('CP', math.pi), np.diag([1, 1, 1, -1]))
+    thetas = np.array([0.3, 1.2, 0.3])
+    stacked = quantum.gate_matrices('P', thetas)
+    for theta, matrix in zip(thetas, stacked):
+        assert np.allclose(matrix, quantum.gate_matrix('P', float(theta)))
+    with pytest.raises(ValueError):
+        quantum.gate_matrix('RX')
+
+    state = quantum.apply_gate_to_state(quantum.initial_state(3), 'H', [1])
+    rows = quantum.apply_matrix_rows(np.stack([state] * 3), quantum.gate_matrices('CP', thetas), (1, 2))
+    for theta, row in zip(thetas, rows):
+        assert np.allclose(row, quantum.apply_gate_to_state(state, 'CP', [1, 2], float(theta)))
+
+
+def test_sweep_matches_pointwise_evaluation():
+    operations = [
+        SweepOperation(gate='H', qubits=[0]),
+        SweepOperation(gate='RY', qubits=[1], param='a'),
+        SweepOperation(gate='CNOT', qubits=[1, 2]),
+        SweepOperation(gate='RZ', qubits=[0], theta=0.7),
+        SweepOperation(gate='CP', qubits=[0, 2], param='b'),
+        SweepOperation(gate='RX', qubits=[2], param='a'),
+    ]
+    parameters = {'a': [0.0, 0.5, 2.0], 'b': [math.pi, 0.1]}
+    names, grid, labels, probabilities = sweep.run_sweep(quantum.initial_state(3), operations, parameters)
+    assert names == ['a', 'b'] and grid.shape == (6, 2) and len(labels) == 8
+    for (a, b), row in zip(grid, probabilities):
+        state = quantum.initial_state(3)
+        for operation in operations:
+            theta = {'a': a, 'b': b}.get(operation.param, operation.theta)
+            state = quantum.apply_gate_to_state(state, operation.gate, operation.qubits, theta)
+        assert np.allclose(row, np.abs(state) ** 2)
+
+    _, _, labels, marginals = sweep.run_sweep(quantum.initial_state(3), operations, parameters, 'Q2')
+    assert labels == ['0', '1'] and np.allclose(marginals, probabilities.reshape(6, 2, 2, 2).sum(axis=(1, 3)))
+
+
+def test_oversized_sweep_is_refused_before_building_the_grid(monkeypatch):
+    def fail(parameters):
+        raise AssertionError('grid was built')
+
+    monkeypatch.setattr(sweep, 'sweep_grid', fail)
+    with pytest.raises(ValueError):
+        sweep.run_sweep(quantum.initial_state(2), [], {name: range(1000) for name in 'abc'})
+
+
+def test_pauli_expectations_match_dense_operators():
+    generator = np.random.default_rng(17)
+    state = generator.normal(size=8) + 1j * generator.normal(size=8)
+    state /= np.linalg.norm(state)
+    paulis = {'I': np.eye(2), 'X': quantum.X, 'Y': np.array([[0, -1j], [1j, 0]]), 'Z': np.diag([1, -1])}
+    strings = ['ZII', 'ZZI', 'XIX', 'YZX', 'IYY', 'III']
+    values = observables.expectation_values(state, strings + ['Z1 Z2', 'Y1 Z2 X3'])
+    for text in strings:
+        operator = np.kron(np.kron(paulis[text[0]], paulis[text[1]]), paulis[text[2]])
+        assert values[text] == pytest.approx(np.vdot(state, operator @ state).real)
+    assert values['Z1 Z2'] == pytest.approx(values['ZZI'])
+    assert values['Y1 Z2 X3'] == pytest.approx(values['YZX'])
+    for invalid in ('ZZ', 'Z4', 'Z1 X1', 'Q1'):
+        with pytest.raises(ValueError):
+            observables.expectation_values(state, [invalid])
+
+
+def test_noise_trajectories_match_channel_averages():
+    generator = rng.create_rng('philox', seed=21)
+    plus = [CircuitOperation(type='gate', gate='H')]
+    shots = 20000
+    model = noise.NoiseModel(amplitude_damping=0.4)
+    _, freqs = noise.run_trials(quantum.initial_state(1), plus, 'ALL', shots, model, generator)
+    assert freqs['1'] == pytest.approx(0.5 * 0.6, abs=0.02)
+
+    flip = [CircuitOperation(type='gate', gate='X', qubits=[1])]
+    model = noise.NoiseModel(depolarizing=0.3, readout_error=0.1)
+    _, freqs = noise.run_trials(quantum.initial_state(2), flip, 'Q2', shots, model, generator)
+    # X and Y errors undo the flip (2/3 of p), then each readout flips with probability 0.1.
+    expected = (1 - 0.2) * 0.9 + 0.2 * 0.1
+    assert freqs['1'] == pytest.approx(expected, abs=0.02)
+
+    state = quantum.apply_gate_to_state(quantum.initial_state(2), 'X')
+    _, probabilities = quantum.trial_distribution(state, 'ALL', readout_error=0.1)
+    assert np.allclose(probabilities, [0.09, 0.01, 0.81, 0.09])
+
+
+def test_normalize_rejects_non_finite_states():
+    for value in (np.nan, np.inf):
+        vector = np.array([value, 0, 0, 0], dtype=np.complex128)
+        with pytest.raises(ValueError):
+            normalize(vector)
+        with pytest.raises(ValueError):
+            normalize_batch(np.stack([quantum.initial_state(), vector]))